@@ -1,13 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import base64
+import functools
+import io
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from loguru import logger
 
-from service.rag import RAG
+from service.jobs import IngestWorkers
 from database.operations import DatabaseOperation
-from .models import DocumentListResponse, DocumentResponse, MessageResponse
+from config import batchMaxFiles, batchMaxFileMB, batchMaxTotalMB, documentPageSize, documentPageMax
+from .models import (
+    DocumentListResponse, DocumentResponse, JobResponse, JobStatusResponse,
+    BatchFileResult, BatchResponse, BatchStatusResponse
+)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
-@router.post("/upload", response_model=MessageResponse)
+@router.post("/upload", response_model=JobResponse, status_code=202)
 async def upload_document(file: UploadFile = File(...)):
     try:
         content_type = file.content_type
@@ -29,18 +40,18 @@ async def upload_document(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Empty file")
         
        
-        document_id = await RAG.processStore_document(
-            file_content, 
+        job_id = await DatabaseOperation.insert_job(
             filename, 
             file_type, 
-            content_type
+            content_type,
+            file_content
         )
-        
-        if not document_id:
-            raise HTTPException(status_code=500, detail="Failed to process document")
+        IngestWorkers.notify()
             
-        return MessageResponse(
-            message=f"PDF document uploaded and processed successfully with ID: {document_id}"
+        return JobResponse(
+            job_id=job_id,
+            status="queued",
+            message=f"PDF document queued for processing with job ID: {job_id}"
         )
         
     except HTTPException as e:
@@ -50,28 +61,202 @@ async def upload_document(file: UploadFile = File(...)):
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+def expand_upload(filename, content_type, file_content):
+    
+    # entries come with their uncompressed size and a reader, so nothing is inflated before it is checked
+    is_zip = filename.lower().endswith(".zip") or "zip" in (content_type or "")
+    if not is_zip:
+        yield filename, content_type, len(file_content), lambda: file_content
+        return
+    
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        for entry in archive.infolist():
+            name = entry.filename
+            if entry.is_dir() or name.startswith("__MACOSX/") or name.rsplit("/", 1)[-1].startswith("."):
+                continue
+            content_type = "application/pdf" if name.lower().endswith(".pdf") else "application/octet-stream"
+            # zipfile stops inflating at the declared file_size, so the check below bounds the read
+            yield name.rsplit("/", 1)[-1], content_type, entry.file_size, functools.partial(archive.read, entry)
+
+@router.post("/upload/batch", response_model=BatchResponse, status_code=202)
+async def upload_batch(files: List[UploadFile] = File(...)):
+    
+    batch_id = str(uuid.uuid4())
+    results = []
+    accepted = []
+    expanded = 0
+    
+    try:
+        # everything is checked before the first job is queued, so a rejected request queues nothing
+        for file in files:
+            file_content = await file.read()
+            entries = []
+            
+            try:
+                for filename, content_type, size, read in expand_upload(file.filename, file.content_type, file_content):
+                    if len(results) + len(entries) >= batchMaxFiles:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"A batch may contain at most {batchMaxFiles} files"
+                        )
+                    
+                    if not ("pdf" in (content_type or "") or filename.lower().endswith(".pdf")):
+                        entries.append((BatchFileResult(
+                            filename=filename,
+                            status="rejected",
+                            error=f"Only PDF files are supported. Got: {content_type}"
+                        ), None))
+                        continue
+                    
+                    if size > batchMaxFileMB * 1024 * 1024:
+                        entries.append((BatchFileResult(
+                            filename=filename,
+                            status="rejected",
+                            error=f"File is larger than {batchMaxFileMB} MB"
+                        ), None))
+                        continue
+                    
+                    expanded += size
+                    if expanded > batchMaxTotalMB * 1024 * 1024:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"A batch may contain at most {batchMaxTotalMB} MB of files after unzipping"
+                        )
+                    
+                    content = read()
+                    if not content:
+                        entries.append((BatchFileResult(filename=filename, status="rejected", error="Empty file"), None))
+                        continue
+                    
+                    entries.append((BatchFileResult(filename=filename, status="queued"), (filename, content_type, content)))
+            except zipfile.BadZipFile as e:
+                results.append(BatchFileResult(filename=file.filename, status="rejected", error=str(e)))
+                continue
+            
+            for result, job in entries:
+                results.append(result)
+                if job is not None:
+                    accepted.append((result, job))
+        
+        job_ids = await DatabaseOperation.insert_jobs([job for _, job in accepted], batch_id=batch_id)
+        for (result, _), job_id in zip(accepted, job_ids):
+            result.job_id = job_id
+        
+        IngestWorkers.notify()
+        
+        queued = len(job_ids)
+        return BatchResponse(
+            batch_id=batch_id,
+            files=results,
+            message=f"Queued {queued} of {len(results)} files for processing in batch {batch_id}"
+        )
+        
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error(f"Error uploading batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error uploading batch: {str(e)}")
+
+@router.get("/batches/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch(batch_id: str):
+    
+    try:
+        jobs = await DatabaseOperation.get_batch_jobs(batch_id)
+        
+        if not jobs:
+            raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+        
+        statuses = [job['status'] for job in jobs]
+        return BatchStatusResponse(
+            batch_id=batch_id,
+            jobs=[JobStatusResponse(**dict(job)) for job in jobs],
+            queued=statuses.count("queued"),
+            running=statuses.count("running"),
+            completed=statuses.count("completed"),
+            failed=statuses.count("failed")
+        )
+        
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting batch {batch_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting batch: {str(e)}")
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: int):
+    
+    try:
+        job = await DatabaseOperation.get_job(job_id)
+        
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        
+        return JobStatusResponse(**dict(job))
+        
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting job: {str(e)}")
+
+def encode_cursor(document):
+    value = f"{document['created_at'].isoformat()}|{document['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, document_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return as_utc(datetime.fromisoformat(created_at)), int(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def as_utc(value):
+    # created_at is a timestamptz; times given without a zone (and cursors from before it was) are UTC
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
 @router.get("/", response_model=DocumentListResponse)
-async def get_documents():
+async def get_documents(
+    limit: int = Query(documentPageSize, ge=1, le=documentPageMax),
+    cursor: Optional[str] = None,
+    filename: Optional[str] = Query(None, max_length=255, description="Filename prefix"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
    
     try:
-        documents = await DatabaseOperation.get_all_docs()
+        after = decode_cursor(cursor) if cursor else None
+        
+        # one extra row tells us whether there is another page
+        documents = await DatabaseOperation.get_all_docs(
+            limit + 1, after, filename, as_utc(created_from), as_utc(created_to)
+        )
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
         
         # Convert to response models
         document_responses = []
-        for doc in documents:
+        for doc in documents[:limit]:
             document_responses.append(DocumentResponse(
                 id=doc['id'],
                 filename=doc['filename'],
                 file_type=doc['file_type'],
                 content_type=doc['content_type'],
+                status=doc['status'],
+                chunk_count=doc['chunk_count'] or 0,
                 created_at=doc['created_at']
             ))
         
         return DocumentListResponse(
             documents=document_responses,
-            total=len(document_responses)
+            total=len(document_responses),
+            next_cursor=next_cursor
         )
         
+    except HTTPException as e:
+        raise
     except Exception as e:
         logger.error(f"Error getting documents: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting documents: {str(e)}")
\ No newline at end of file
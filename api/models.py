@@ -1,14 +1,17 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 class DocumentSelectionRequest(BaseModel):
     
     document_ids: List[int] = Field(..., description="List of document IDs to use for Q&A")
+    selection_id: str = Field("default", max_length=64, description="Selection to store these documents under")
 
 class QuestionRequest(BaseModel):
    
     question: str = Field(..., description="The question to answer")
+    selection_id: str = Field("default", max_length=64, description="Document selection to answer from")
+    use_cache: bool = Field(True, description="Set to false to skip the answer cache and generate a fresh answer")
 
 class DocumentResponse(BaseModel):
     
@@ -16,12 +19,15 @@ class DocumentResponse(BaseModel):
     filename: str
     file_type: str
     content_type: str
+    status: str = "ready"
+    chunk_count: int = 0
     created_at: datetime
 
 class DocumentListResponse(BaseModel):
    
     documents: List[DocumentResponse]
     total: int
+    next_cursor: Optional[str] = None
 
 class AnswerResponse(BaseModel):
    
@@ -32,4 +38,54 @@ class AnswerResponse(BaseModel):
 class MessageResponse(BaseModel):
   
     message: str
-    success: bool = True
\ No newline at end of file
+    success: bool = True
+
+class SelectionResponse(MessageResponse):
+
+    selection_id: str
+
+class JobResponse(BaseModel):
+
+    job_id: int
+    status: str
+    message: str
+
+class JobStatusResponse(BaseModel):
+
+    id: int
+    filename: str
+    status: str
+    attempts: int
+    pages_parsed: int
+    chunks_embedded: int
+    chunks_stored: int
+    chunks_reused: int = 0
+    tokens_truncated: int = 0
+    legacy_tokens_truncated: int = 0
+    document_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+class BatchFileResult(BaseModel):
+
+    filename: str
+    job_id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+
+    batch_id: str
+    files: List[BatchFileResult]
+    message: str
+
+class BatchStatusResponse(BaseModel):
+
+    batch_id: str
+    jobs: List[JobStatusResponse]
+    queued: int
+    running: int
+    completed: int
+    failed: int
\ No newline at end of file
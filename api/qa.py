@@ -1,12 +1,20 @@
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from loguru import logger
 from datetime import datetime
 
 from service.rag import RAG
-from .models import QuestionRequest, AnswerResponse, DocumentSelectionRequest, MessageResponse
+from service.embedding import Embedding
+from service.answers import AnswerCache
+from service.admission import Overloaded
+from .models import QuestionRequest, AnswerResponse, DocumentSelectionRequest, SelectionResponse
 
 router = APIRouter(prefix="/qa", tags=["qa"])
 
+def overloaded(e):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 @router.post("/ask", response_model=AnswerResponse)
 async def ask_question(request: QuestionRequest):
   
@@ -16,7 +24,7 @@ async def ask_question(request: QuestionRequest):
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
     
-        answer = await RAG.answer_question(request.question)
+        answer = await RAG.answer_question(request.question, request.selection_id, request.use_cache)
         
         if not answer:
             raise HTTPException(status_code=500, detail="Failed to generate answer")
@@ -29,11 +37,48 @@ async def ask_question(request: QuestionRequest):
         
     except HTTPException as e:
         raise
+    except Overloaded as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"Error answering question: {e}")
         raise HTTPException(status_code=500, detail=f"Error answering question: {str(e)}")
 
-@router.post("/documents", response_model=MessageResponse)
+@router.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    
+    if not request.question or len(request.question.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    # the first event comes after the LLM slot is granted, so an overloaded service can
+    # still answer with a status code instead of an open stream
+    answer = RAG.answer_stream(request.question, request.selection_id, request.use_cache)
+    try:
+        first = await answer.__anext__()
+    except Overloaded as e:
+        raise overloaded(e)
+    except Exception as e:
+        first = e
+    
+    async def events():
+        try:
+            if isinstance(first, Exception):
+                raise first
+            event, data = first
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            async for event, data in answer:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+        yield "event: done\ndata: null\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/documents", response_model=SelectionResponse)
 async def select_documents(request: DocumentSelectionRequest):
   
     try:
@@ -42,14 +87,30 @@ async def select_documents(request: DocumentSelectionRequest):
             raise HTTPException(status_code=400, detail="Document IDs list cannot be empty")
         
        
-        await RAG.doc_selection(request.document_ids)
+        await RAG.doc_selection(request.document_ids, request.selection_id)
         
-        return MessageResponse(
-            message=f"Selected {len(request.document_ids)} documents for Q&A"
+        return SelectionResponse(
+            message=f"Selected {len(request.document_ids)} documents for Q&A",
+            selection_id=request.selection_id
         )
         
     except HTTPException as e:
         raise
     except Exception as e:
         logger.error(f"Error selecting documents: {e}")
-        raise HTTPException(status_code=500, detail=f"Error selecting documents: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error selecting documents: {str(e)}")
+
+@router.get("/cache")
+async def cache_stats():
+    return {
+        "query_embeddings": Embedding.query_cache.stats(),
+        "answers": AnswerCache.stats()
+    }
+
+@router.get("/load")
+async def load_stats():
+    return {
+        "llm": RAG.admission.stats(),
+        "in_flight": len(RAG.flights.flights),
+        "coalesced": RAG.flights.coalesced
+    }
\ No newline at end of file
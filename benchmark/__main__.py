@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime
+from loguru import logger
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def parse_size(value):
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+def parse_list(value):
+    return [parse_size(item) for item in value.split(",") if item.strip()]
+
+def run(args):
+    # the hash backend stands in for the model; config reads this at import
+    os.environ["embeddingBackend"] = "hash"
+    # hash vectors are close to orthogonal, so any real cut-off would leave every search empty
+    os.environ.setdefault("simi_threshold", "-1")
+    from .run import Benchmark
+
+    benchmark = Benchmark(
+        sizes=args.sizes,
+        concurrency=args.concurrency,
+        queries=args.queries,
+        chunks_per_doc=args.chunks_per_doc,
+        pipeline_pages=args.pipeline_pages,
+        use_db=not args.no_db,
+        reset=args.reset,
+        seed=args.seed,
+        ollama_delay=args.ollama_delay,
+        recall_size=args.recall_size,
+    )
+    report = asyncio.run(benchmark.run())
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    commit = (report["commit"] or "unknown")[:8]
+    path = os.path.join(args.output, f"{stamp}-{commit}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results written to {path}")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline  {baseline['commit']}  {baseline['timestamp']}")
+    print(f"candidate {candidate['commit']}  {candidate['timestamp']}")
+
+    before = {run["chunks"]: run for run in baseline["runs"]}
+    for run in candidate["runs"]:
+        old = before.get(run["chunks"])
+        if old is None:
+            continue
+        print(f"\n{run['chunks']} chunks")
+
+        for stage in ("ingest", "pipeline"):
+            if run.get(stage) and old.get(stage):
+                a, b = old[stage]["chunks_per_sec"], run[stage]["chunks_per_sec"]
+                print(f"  {stage:<8} {a:>10.0f} -> {b:>10.0f} chunks/sec  ({b / a:.2f}x)")
+
+        for stage in ("search", "answer"):
+            levels = {level["concurrency"]: level for level in old.get(stage, [])}
+            for level in run.get(stage, []):
+                previous = levels.get(level["concurrency"])
+                if previous is None:
+                    continue
+                if previous["p50_ms"] is None or level["p50_ms"] is None:
+                    latency = "no completed requests"
+                else:
+                    latency = (
+                        f"p50 {previous['p50_ms']:.2f} -> {level['p50_ms']:.2f} ms  "
+                        f"p99 {previous['p99_ms']:.2f} -> {level['p99_ms']:.2f} ms"
+                    )
+                shed = sum(previous.get("rejected", {}).values()), sum(level.get("rejected", {}).values())
+                print(
+                    f"  {stage:<8} c={level['concurrency']:<3} {latency}"
+                    + (f"  rejected {shed[0]} -> {shed[1]}" if any(shed) else "")
+                )
+
+        recall = {(level["quantization"], level["oversample"]): level for level in old.get("recall", [])}
+        for level in run.get("recall", []):
+            previous = recall.get((level["quantization"], level["oversample"]))
+            if previous is None:
+                continue
+            metric = next(name for name in level if name.startswith("recall_at_"))
+            print(
+                f"  recall   {level['quantization']:<6} x{level['oversample']:<2} "
+                f"{previous.get(metric, 0):.3f} -> {level[metric]:.3f}"
+            )
+
+        print(f"  peak rss {old['peak_rss_mb']:.0f} -> {run['peak_rss_mb']:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark")
+    commands = parser.add_subparsers(dest="command")
+
+    runner = commands.add_parser("run", help="run the benchmark and write a JSON report")
+    runner.add_argument("--sizes", type=parse_list, default=parse_list("1k,10k,100k,1M"),
+                        help="corpus sizes in chunks, grown incrementally (default 1k,10k,100k,1M)")
+    runner.add_argument("--concurrency", type=parse_list, default=[1, 4, 16, 64])
+    runner.add_argument("--queries", type=int, default=200, help="requests per concurrency level")
+    runner.add_argument("--chunks-per-doc", type=int, default=200)
+    runner.add_argument("--pipeline-pages", type=int, default=50,
+                        help="pages in the PDF pushed through the full ingest pipeline per size, 0 to skip")
+    runner.add_argument("--no-db", action="store_true",
+                        help="benchmark the in-memory index only, without Postgres")
+    runner.add_argument("--reset", action="store_true",
+                        help="truncate all tables first; only use against a scratch database")
+    runner.add_argument("--recall-size", type=parse_size, default=100_000,
+                        help="vectors kept for measuring quantized recall against exact search")
+    runner.add_argument("--seed", type=int, default=0)
+    runner.add_argument("--ollama-delay", type=float, default=0.05,
+                        help="seconds the stub LLM waits before answering")
+    runner.add_argument("--output", default=RESULTS_DIR)
+
+    comparer = commands.add_parser("compare", help="compare two JSON reports")
+    comparer.add_argument("baseline")
+    comparer.add_argument("candidate")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args)
+    elif args.command == "run":
+        run(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ten", "ra", "vel", "son", "dri", "pa", "qu",
+    "ex", "tor", "ni", "bel", "cha", "fo", "gra", "hem", "is", "jun",
+]
+
+class Corpus:
+
+    def __init__(self, seed=0, vocabulary=5000):
+        self.rng = np.random.default_rng(seed)
+        self.words = self._vocabulary(vocabulary)
+
+    def _vocabulary(self, size):
+        words = set()
+        while len(words) < size:
+            length = self.rng.integers(1, 4)
+            words.add("".join(self.rng.choice(SYLLABLES, size=length)))
+        return list(self.rng.permutation(sorted(words)))
+
+    def text(self, words=150):
+        # zipf-like word frequencies plus the odd part number, so full-text search has something to match
+        ranks = np.minimum(self.rng.zipf(1.2, size=words), len(self.words)) - 1
+        tokens = [self.words[rank] for rank in ranks]
+        tokens[self.rng.integers(0, words)] = f"PN-{self.rng.integers(10000, 99999)}"
+        return " ".join(tokens) + "."
+
+    def chunks(self, count, words=150):
+        return [(index, self.text(words)) for index in range(count)]
+
+    def pdf(self, pages, words_per_page=400):
+        return make_pdf([self.text(words_per_page) for _ in range(pages)])
+
+def _escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def make_pdf(page_texts):
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    page_ids = []
+    for text in page_texts:
+        lines = " T* ".join(f"({_escape(line)}) Tj" for line in _wrap(text))
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {lines} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+from loguru import logger
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import service.llm
+from database.connection import get_pool, init_database, close_pool
+from database.operations import DatabaseOperation
+from service.embedding import Embedding
+from service.executor import Executor
+from service.index import ChunkIndex
+from service.llm import LLM
+from service.rag import RAG
+from service.admission import Overloaded
+from .corpus import Corpus
+from .stubs import StubOllama
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(latencies, wall, concurrency, rejected=None):
+    values = np.asarray(latencies) * 1000
+    percentile = lambda q: float(np.percentile(values, q)) if len(values) else None
+    return {
+        "concurrency": concurrency,
+        "requests": len(values),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": float(values.mean()) if len(values) else None,
+        "throughput_per_sec": len(values) / wall if wall > 0 else 0.0,
+        "rejected": rejected or {},
+    }
+
+async def measure(fn, inputs, concurrency):
+    # latencies cover completed requests; load shedding (429 / 503) is counted separately
+    latencies = []
+    rejected = {}
+    pending = iter(inputs)
+
+    async def worker():
+        for item in pending:
+            started = time.perf_counter()
+            try:
+                await fn(item)
+            except Overloaded as e:
+                rejected[str(e.status_code)] = rejected.get(str(e.status_code), 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, concurrency, rejected)
+
+def recall_at_k(vectors, queries, k, quantization, oversample):
+    # the quantized shortlist is rescored exactly, as index_chunks_search does
+    matrix = ChunkIndex.normalize(vectors)
+    codes, scales = ChunkIndex.quantize(matrix, quantization)
+    k = min(k, len(matrix))
+    shortlist = min(k * oversample, len(matrix))
+
+    found = 0
+    for query in ChunkIndex.normalize(queries):
+        exact = matrix @ query
+        truth = np.argpartition(-exact, k - 1)[:k]
+        approximate = ChunkIndex.approximate(codes, scales, query, quantization)
+        candidates = np.argpartition(-approximate, shortlist - 1)[:shortlist]
+        rescored = candidates[np.argsort(-exact[candidates])[:k]]
+        found += len(np.intersect1d(truth, rescored))
+    return found / (k * len(queries))
+
+def git_state():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+class Benchmark:
+
+    def __init__(self, sizes, concurrency, queries, chunks_per_doc=200, pipeline_pages=50,
+                 use_db=True, reset=False, seed=0, ollama_delay=0.05, recall_size=100_000):
+        self.sizes = sorted(sizes)
+        self.concurrency = concurrency
+        self.queries = queries
+        self.chunks_per_doc = chunks_per_doc
+        self.pipeline_pages = pipeline_pages
+        self.use_db = use_db
+        self.reset = reset
+        self.corpus = Corpus(seed)
+        self.ollama = StubOllama(first_token_delay=ollama_delay)
+        self.loaded = 0
+        self.recall_size = recall_size
+        self.reference = []
+        self.referenced = 0
+
+    async def setup(self):
+        Embedding.get_model()
+        service.llm.ollamaUrl = await self.ollama.start()
+        await LLM.open_session()
+
+        if not self.use_db:
+            ChunkIndex.begin_load()
+            ChunkIndex.finish_load()
+            return
+
+        await init_database()
+        if self.reset:
+            logger.warning("Resetting benchmark database")
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await conn.execute("TRUNCATE documents, document_selections, ingest_jobs RESTART IDENTITY CASCADE")
+        if config.searchBackend == "memory":
+            await DatabaseOperation.load_index()
+        self.loaded = ChunkIndex.size
+
+    async def teardown(self):
+        await LLM.close_session()
+        await self.ollama.stop()
+        Executor.shutdown()
+        if self.use_db:
+            await close_pool()
+
+    async def grow(self, target):
+        count = target - self.loaded
+        if count <= 0:
+            return None
+
+        started = time.perf_counter()
+        stored = 0
+        while stored < count:
+            chunks = self.corpus.chunks(min(self.chunks_per_doc, count - stored))
+            embeddings = await Embedding.batchEmbeddings([text for _, text in chunks])
+            if self.referenced < self.recall_size:
+                kept = np.asarray(embeddings[:self.recall_size - self.referenced], dtype=np.float32)
+                self.reference.append(kept)
+                self.referenced += len(kept)
+
+            if self.use_db:
+                document_id, chunk_ids = await DatabaseOperation.store_document(
+                    f"synthetic-{self.loaded + stored}.pdf", "pdf", "application/pdf", chunks, embeddings
+                )
+            else:
+                document_id = self.loaded + stored
+                chunk_ids = list(range(self.loaded + stored, self.loaded + stored + len(chunks)))
+            await ChunkIndex.offload(ChunkIndex.add, chunk_ids, document_id, embeddings)
+            stored += len(chunks)
+
+        elapsed = time.perf_counter() - started
+        self.loaded += stored
+        return {"chunks": stored, "seconds": elapsed, "chunks_per_sec": stored / elapsed}
+
+    async def pipeline(self):
+        if not self.use_db or not self.pipeline_pages:
+            return None
+
+        pdf = self.corpus.pdf(self.pipeline_pages)
+        counts = {}
+
+        async def progress(**fields):
+            counts.update({name: value for name, value in fields.items() if value is not None})
+
+        started = time.perf_counter()
+        document_id = await RAG.processStore_document(
+            pdf, f"pipeline-{self.loaded}.pdf", "pdf", "application/pdf", progress=progress
+        )
+        elapsed = time.perf_counter() - started
+
+        stored = counts.get("chunks_stored", 0)
+        self.loaded += stored
+        return {
+            "document_id": document_id,
+            "pages": self.pipeline_pages,
+            "bytes": len(pdf),
+            "chunks": stored,
+            "seconds": elapsed,
+            "chunks_per_sec": stored / elapsed if elapsed > 0 else 0.0,
+            "pages_per_sec": self.pipeline_pages / elapsed if elapsed > 0 else 0.0,
+        }
+
+    async def search(self, question):
+        embedding = await Embedding.generate_Embedding(question)
+        if self.use_db:
+            await DatabaseOperation.similar_chunks_search(embedding, config.topK)
+        else:
+            ChunkIndex.search(embedding, None, config.topK)
+
+    async def recall(self):
+        if not self.reference:
+            return []
+
+        vectors = np.concatenate(self.reference)
+        queries = await Embedding.batchEmbeddings([self.corpus.text(12) for _ in range(100)])
+        return [
+            {
+                "quantization": quantization,
+                "oversample": oversample,
+                "vectors": len(vectors),
+                f"recall_at_{config.topK}": recall_at_k(vectors, queries, config.topK, quantization, oversample),
+            }
+            for quantization in ("int8", "binary")
+            for oversample in (1, 2, 4, 8)
+        ]
+
+    async def run_size(self, size):
+        logger.info(f"Growing corpus to {size} chunks")
+        result = {"chunks": size, "ingest": await self.grow(size), "pipeline": await self.pipeline()}
+        result["indexed_chunks"] = ChunkIndex.size
+
+        result["search"] = []
+        result["answer"] = []
+        for concurrency in self.concurrency:
+            # fresh questions per level, so the query embedding cache doesn't flatter later runs
+            questions = [self.corpus.text(12) for _ in range(self.queries)]
+            result["search"].append(await measure(self.search, questions, concurrency))
+
+            if self.use_db:
+                questions = [self.corpus.text(12) for _ in range(self.queries)]
+                result["answer"].append(await measure(RAG.answer_question, questions, concurrency))
+
+        result["recall"] = await self.recall()
+        result["peak_rss_mb"] = peak_rss_mb()
+        logger.info(f"{size} chunks: {result['search']}")
+        return result
+
+    async def run(self):
+        commit, dirty = git_state()
+        report = {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "settings": {
+                "database": self.use_db,
+                "searchBackend": config.searchBackend,
+                "retrievalMode": config.retrievalMode,
+                "embeddingDim": config.embeddingDim,
+                "indexQuantization": config.indexQuantization,
+                "rescoreOversample": config.rescoreOversample,
+                "topK": config.topK,
+                "queries": self.queries,
+                "concurrency": self.concurrency,
+                "chunks_per_doc": self.chunks_per_doc,
+                "pipeline_pages": self.pipeline_pages,
+            },
+            "runs": [],
+        }
+
+        await self.setup()
+        try:
+            for size in self.sizes:
+                report["runs"].append(await self.run_size(size))
+        finally:
+            await self.teardown()
+
+        report["peak_rss_mb"] = peak_rss_mb()
+        return report
@@ -0,0 +1,46 @@
+import asyncio
+import json
+from aiohttp import web
+
+class StubOllama:
+
+    def __init__(self, first_token_delay=0.05, tokens=32, token_delay=0.0):
+        self.first_token_delay = first_token_delay
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.runner = None
+        self.url = None
+
+    async def generate(self, request):
+        body = await request.json()
+        await asyncio.sleep(self.first_token_delay)
+        words = [f"word{index} " for index in range(self.tokens)]
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.token_delay * self.tokens)
+            return web.json_response({"response": "".join(words), "done": True})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for word in words:
+            await response.write((json.dumps({"response": word, "done": False}) + "\n").encode())
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        await response.write(b'{"response": "", "done": true}\n')
+        return response
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/api/generate"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
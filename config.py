@@ -13,12 +13,39 @@ user_password = os.getenv("user_password", "postgres")
 
 ollamaUrl = os.getenv("ollamaUrl", "http://localhost:11434/api/generate")
 ollamaModel = os.getenv("ollamaModel", "llama3")
+ollamaConnections = int(os.getenv("ollamaConnections", "16"))
+ollamaKeepalive = float(os.getenv("ollamaKeepalive", "30"))
+ollamaTimeout = float(os.getenv("ollamaTimeout", "60"))
+llmConcurrency = int(os.getenv("llmConcurrency", "4"))
+llmQueueDepth = int(os.getenv("llmQueueDepth", "32"))
+llmQueueTimeout = float(os.getenv("llmQueueTimeout", "15"))
 
 embeddingMod = os.getenv("embeddingMod", "sentence-transformers/all-MiniLM-L6-v2")
+embeddingBackend = os.getenv("embeddingBackend", "sentence-transformers")
+embeddingModelDir = os.getenv("embeddingModelDir", "")
+embeddingBatchSize = int(os.getenv("embeddingBatchSize", "32"))
+embeddingThreads = int(os.getenv("embeddingThreads", "0"))
+queryCacheMB = int(os.getenv("queryCacheMB", "32"))
+queryCacheTTL = int(os.getenv("queryCacheTTL", "3600"))
+queryBatchSize = int(os.getenv("queryBatchSize", "32"))
+queryBatchWaitMs = float(os.getenv("queryBatchWaitMs", "5"))
+answerCacheMB = int(os.getenv("answerCacheMB", "16"))
+answerCacheTTL = int(os.getenv("answerCacheTTL", "3600"))
+answerCacheThreshold = float(os.getenv("answerCacheThreshold", "0.95"))
+answerCacheEntries = int(os.getenv("answerCacheEntries", "256"))
 
 
 chunkSize = int(os.getenv("chunkSize", "1000"))
 chunkOver = int(os.getenv("chunkOver", "200"))
+chunker = os.getenv("chunker", "tokens")
+chunkTokens = int(os.getenv("chunkTokens", "256"))
+chunkOverlapTokens = int(os.getenv("chunkOverlapTokens", "32"))
+contextTokens = int(os.getenv("contextTokens", "2048"))
+charsPerToken = int(os.getenv("charsPerToken", "4"))
+pageBatch = int(os.getenv("pageBatch", "8"))
+ingestBatchSize = int(os.getenv("ingestBatchSize", "64"))
+ingestQueueDepth = int(os.getenv("ingestQueueDepth", "4"))
+batchEmbedSize = int(os.getenv("batchEmbedSize", "256"))
 
 
 langchain_splitter = os.getenv("langchain_splitter", "recursive")
@@ -26,4 +53,65 @@ langchain_LOADER = os.getenv("langchain_LOADER", "pypdf")
 
 
 topK = int(os.getenv("topK", "3"))
-simi_threshold= float(os.getenv("simi_threshold", "0.5"))
\ No newline at end of file
+simi_threshold= float(os.getenv("simi_threshold", "0.5"))
+selectionCacheMB = int(os.getenv("selectionCacheMB", "8"))
+selectionCacheTTL = int(os.getenv("selectionCacheTTL", "30"))
+retrievalMode = os.getenv("retrievalMode", "hybrid")
+hybridCandidates = int(os.getenv("hybridCandidates", "20"))
+rrfK = int(os.getenv("rrfK", "60"))
+ftsConfig = os.getenv("ftsConfig", "english")
+lexicalThreshold = float(os.getenv("lexicalThreshold", "0"))
+documentPageSize = int(os.getenv("documentPageSize", "100"))
+documentPageMax = int(os.getenv("documentPageMax", "1000"))
+
+
+searchBackend = os.getenv("searchBackend", "memory")
+embeddingDim = int(os.getenv("embeddingDim", "384"))
+# the weights the backend loads: sentence-transformers always loads embeddingMod, torch-int8
+# prefers embeddingModelDir, onnx only reads embeddingModelDir
+embeddingModelSource = embeddingMod if embeddingBackend == "sentence-transformers" else (embeddingModelDir or embeddingMod)
+# stored with each chunk so vectors from different models are never mixed; int8 and ONNX
+# vectors differ slightly from the original model's, so those backends are part of the ID
+if embeddingBackend == "hash":
+    embeddingModelId = f"hash-{embeddingDim}"
+elif embeddingBackend == "sentence-transformers":
+    embeddingModelId = embeddingMod
+else:
+    embeddingModelId = f"{embeddingBackend}:{os.path.normpath(embeddingModelSource)}"
+pgvectorIndex = os.getenv("pgvectorIndex", "hnsw")
+pgvectorLists = int(os.getenv("pgvectorLists", "100"))
+pgvectorProbes = int(os.getenv("pgvectorProbes", "10"))
+hnswEfSearch = int(os.getenv("hnswEfSearch", "40"))
+pgvectorFilteredSearch = os.getenv("pgvectorFilteredSearch", "iterative")
+indexQuantization = os.getenv("indexQuantization", "none")
+rescoreOversample = int(os.getenv("rescoreOversample", "4"))
+indexDir = os.getenv("indexDir", "")
+indexMaxSegments = int(os.getenv("indexMaxSegments", "32"))
+indexMaxTombstones = int(os.getenv("indexMaxTombstones", "1000"))
+indexCatchUpInterval = float(os.getenv("indexCatchUpInterval", "1.0"))
+indexCatchUpLag = float(os.getenv("indexCatchUpLag", "30"))
+
+
+queryWorkers = int(os.getenv("queryWorkers", "2"))
+encodeWorkers = int(os.getenv("encodeWorkers", "1"))
+parseWorkers = int(os.getenv("parseWorkers", str(max(1, (os.cpu_count() or 2) // 2))))
+executorQueueDepth = int(os.getenv("executorQueueDepth", "16"))
+
+
+ingestWorkers = int(os.getenv("ingestWorkers", "2"))
+batchMaxFiles = int(os.getenv("batchMaxFiles", "5000"))
+batchMaxFileMB = int(os.getenv("batchMaxFileMB", "100"))
+batchMaxTotalMB = int(os.getenv("batchMaxTotalMB", "1024"))
+jobClaimBatch = int(os.getenv("jobClaimBatch", "8"))
+jobPollInterval = float(os.getenv("jobPollInterval", "2.0"))
+jobStaleAfter = int(os.getenv("jobStaleAfter", "600"))
+jobMaxAttempts = int(os.getenv("jobMaxAttempts", "3"))
+jobHeartbeat = float(os.getenv("jobHeartbeat", "30"))
+
+
+embeddingMigrateBatch = int(os.getenv("embeddingMigrateBatch", "1000"))
+migrateOnStartup = os.getenv("migrateOnStartup", "false").lower() == "true"
+warmupOnStartup = os.getenv("warmupOnStartup", "true").lower() == "true"
+startupRetries = int(os.getenv("startupRetries", "5"))
+startupRetryDelay = float(os.getenv("startupRetryDelay", "2.0"))
+serverTiming = os.getenv("serverTiming", "false").lower() == "true"
@@ -0,0 +1,41 @@
+import json
+import struct
+import numpy as np
+
+class EmbeddingCodec:
+
+    # header: magic, format version, dtype code, dimension (little-endian)
+    MAGIC = b"EV"
+    VERSION = 1
+    FLOAT32 = 1
+    HEADER = struct.Struct("<2sBBI")
+    DTYPES = {FLOAT32: np.dtype("<f4")}
+
+    @classmethod
+    def encode(cls, embedding):
+        vector = np.asarray(embedding, dtype=cls.DTYPES[cls.FLOAT32]).reshape(-1)
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.FLOAT32, vector.shape[0])
+        return header + vector.tobytes()
+
+    @staticmethod
+    def to_vector_literal(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return "[" + ",".join(map(str, vector.tolist())) + "]"
+
+    @staticmethod
+    def is_legacy(data):
+        return data[:1] == b"["
+
+    @classmethod
+    def decode(cls, data):
+        if data is None:
+            return None
+
+        if cls.is_legacy(data):
+            return np.asarray(json.loads(bytes(data).decode("utf-8")), dtype=np.float32)
+
+        magic, version, dtype, dimension = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION or dtype not in cls.DTYPES:
+            raise ValueError(f"Unknown embedding encoding: magic={magic!r} version={version} dtype={dtype}")
+
+        return np.frombuffer(data, dtype=cls.DTYPES[dtype], count=dimension, offset=cls.HEADER.size)
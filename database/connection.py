@@ -1,11 +1,21 @@
+import asyncio
 import asyncpg
+import re
 import sys
 import os
+import time
+from contextlib import asynccontextmanager
 from loguru import logger
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import dbHost, port, dbName, user_name, user_password
+from config import (
+    dbHost, port, dbName, user_name, user_password,
+    searchBackend, embeddingDim, pgvectorIndex, pgvectorLists, pgvectorFilteredSearch, ftsConfig
+)
+from service.metrics import Metrics
 
 pool = None
+# filled in by init_pgvector
+pgvector_features = {"iterative_scan": False}
 
 async def get_pool():
     global pool
@@ -21,6 +31,28 @@ async def get_pool():
         )
     return pool
 
+@asynccontextmanager
+async def acquire():
+    pool = await get_pool()
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        Metrics.observe_pool_wait(time.perf_counter() - started)
+        yield conn
+
+async def ping(timeout=2.0):
+    if pool is None:
+        return False
+
+    async def select_one():
+        async with acquire() as conn:
+            return await conn.fetchval("SELECT 1")
+
+    try:
+        return await asyncio.wait_for(select_one(), timeout) == 1
+    except Exception as e:
+        logger.warning(f"Database ping failed: {e}")
+        return False
+
 async def init_database():
     logger.info("Initializing database...")
     
@@ -32,10 +64,33 @@ async def init_database():
             filename VARCHAR(255) NOT NULL,
             file_type VARCHAR(50) NOT NULL,
             content_type VARCHAR(100) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
         )
         """)
         
+        # created_at used to be a plain TIMESTAMP holding the session's local time, so the same row read
+        # as a different instant under another time zone; existing values are converted in that zone
+        await conn.execute("""
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'documents' AND column_name = 'created_at'
+            ) = 'timestamp without time zone' THEN
+                ALTER TABLE documents ALTER COLUMN created_at TYPE TIMESTAMPTZ;
+            END IF;
+        END $$
+        """)
+        
+        await conn.execute("""
+        ALTER TABLE documents
+        ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'ready',
+        ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash)
+        """)
+        
         await conn.execute("""
         CREATE TABLE IF NOT EXISTS document_chunks (
             id SERIAL PRIMARY KEY,
@@ -48,6 +103,57 @@ async def init_database():
         )
         """)
         
+        await conn.execute("""
+        ALTER TABLE document_chunks
+        ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR(64),
+        ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(255)
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS document_chunks_hash
+        ON document_chunks (chunk_hash, embedding_model)
+        """)
+        
+        # generated columns can't take parameters, so the text search config is inlined
+        if not re.fullmatch(r"[A-Za-z_]+", ftsConfig):
+            raise ValueError(f"Invalid ftsConfig: {ftsConfig}")
+        await conn.execute(f"""
+        ALTER TABLE document_chunks
+        ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('{ftsConfig}', chunk_text)) STORED
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS document_chunks_tsv
+        ON document_chunks USING GIN (chunk_tsv)
+        """)
+        
+        # rows that predate the column get counted once, in a single pass
+        await conn.execute("""
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_count INTEGER
+        """)
+        await conn.execute("""
+        UPDATE documents d
+        SET chunk_count = (SELECT count(*) FROM document_chunks dc WHERE dc.document_id = d.id)
+        WHERE chunk_count IS NULL
+        """)
+        await conn.execute("""
+        ALTER TABLE documents ALTER COLUMN chunk_count SET DEFAULT 0
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS documents_created_at_id ON documents (created_at DESC, id DESC)
+        """)
+        
+        # bumped from one shared sequence whenever a document's chunks are written, so answers
+        # cached for a selection can tell that its documents changed
+        await conn.execute("""
+        CREATE SEQUENCE IF NOT EXISTS document_versions
+        """)
+        await conn.execute("""
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0
+        """)
+        
       
         await conn.execute("""
         CREATE TABLE IF NOT EXISTS document_selections (
@@ -57,6 +163,96 @@ async def init_database():
             UNIQUE (document_id)
         )
         """)
+        
+        # selections used to be one global set; existing rows become the "default" selection
+        await conn.execute("""
+        ALTER TABLE document_selections
+        ADD COLUMN IF NOT EXISTS selection_id VARCHAR(64) NOT NULL DEFAULT 'default'
+        """)
+        
+        await conn.execute("""
+        ALTER TABLE document_selections
+        DROP CONSTRAINT IF EXISTS document_selections_document_id_key
+        """)
+        
+        await conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS document_selections_selection
+        ON document_selections (selection_id, document_id)
+        """)
+        
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            file_type VARCHAR(50) NOT NULL,
+            content_type VARCHAR(100) NOT NULL,
+            file_content BYTEA,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            pages_parsed INTEGER NOT NULL DEFAULT 0,
+            chunks_embedded INTEGER NOT NULL DEFAULT 0,
+            chunks_stored INTEGER NOT NULL DEFAULT 0,
+            document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """)
+        
+        await conn.execute("""
+        ALTER TABLE ingest_jobs
+        ADD COLUMN IF NOT EXISTS chunks_reused INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36),
+        ADD COLUMN IF NOT EXISTS tokens_truncated INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS legacy_tokens_truncated INTEGER NOT NULL DEFAULT 0
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS ingest_jobs_document
+        ON ingest_jobs (document_id) WHERE status = 'running'
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS ingest_jobs_batch
+        ON ingest_jobs (batch_id) WHERE batch_id IS NOT NULL
+        """)
+        
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS ingest_jobs_pending
+        ON ingest_jobs (id) WHERE status IN ('queued', 'running')
+        """)
+        
+        if searchBackend == "pgvector":
+            await init_pgvector(conn)
+
+async def init_pgvector(conn):
+    logger.info(f"Initializing pgvector {pgvectorIndex} index...")
+    
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    pgvector_features["iterative_scan"] = tuple(int(part) for part in re.findall(r"\d+", version)[:2]) >= (0, 8)
+    if pgvectorFilteredSearch == "iterative" and not pgvector_features["iterative_scan"]:
+        logger.warning(f"pgvector {version} has no iterative index scans; filtered searches will scan exactly")
+    await conn.execute(f"""
+    ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS embedding_vec vector({int(embeddingDim)})
+    """)
+    
+    if pgvectorIndex == "ivfflat":
+        # ivfflat picks its list centroids at build time, so build it once data is loaded
+        await conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS document_chunks_embedding_ivfflat
+        ON document_chunks USING ivfflat (embedding_vec vector_cosine_ops)
+        WITH (lists = {int(pgvectorLists)})
+        """)
+    elif pgvectorIndex == "hnsw":
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS document_chunks_embedding_hnsw
+        ON document_chunks USING hnsw (embedding_vec vector_cosine_ops)
+        """)
+    else:
+        raise ValueError(f"Unknown pgvectorIndex: {pgvectorIndex}")
 
 async def close_pool():
     global pool
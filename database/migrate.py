@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import os
+from loguru import logger
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import embeddingMigrateBatch
+from database.connection import acquire, close_pool, init_database, init_pgvector
+from database.codec import EmbeddingCodec
+
+async def migrate_embeddings(batch_size=embeddingMigrateBatch):
+    logger.info("Migrating JSON chunk embeddings to binary format...")
+
+    last_id = 0
+    migrated = 0
+
+    while True:
+        async with acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """
+                    SELECT id, chunk_embedding
+                    FROM document_chunks
+                    WHERE id > $1
+                      AND chunk_embedding IS NOT NULL
+                      AND get_byte(chunk_embedding, 0) = 91
+                    ORDER BY id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    last_id, batch_size
+                )
+
+                if not rows:
+                    break
+
+                ids = [row['id'] for row in rows]
+                embeddings = [
+                    EmbeddingCodec.encode(EmbeddingCodec.decode(row['chunk_embedding']))
+                    for row in rows
+                ]
+
+                await conn.execute(
+                    """
+                    UPDATE document_chunks dc
+                    SET chunk_embedding = v.embedding
+                    FROM unnest($1::int[], $2::bytea[]) AS v(id, embedding)
+                    WHERE dc.id = v.id
+                    """,
+                    ids, embeddings
+                )
+
+        last_id = ids[-1]
+        migrated += len(ids)
+        logger.info(f"Migrated {migrated} chunk embeddings")
+
+        # yield between batches so a background run doesn't starve request handling
+        await asyncio.sleep(0)
+
+    logger.info(f"Embedding migration finished, {migrated} rows rewritten")
+    return migrated
+
+async def migrate_vectors(batch_size=embeddingMigrateBatch):
+    logger.info("Copying chunk embeddings into the pgvector column...")
+
+    async with acquire() as conn:
+        await init_pgvector(conn)
+
+    last_id = 0
+    migrated = 0
+
+    while True:
+        async with acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """
+                    SELECT id, chunk_embedding
+                    FROM document_chunks
+                    WHERE id > $1
+                      AND chunk_embedding IS NOT NULL
+                      AND embedding_vec IS NULL
+                    ORDER BY id
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    last_id, batch_size
+                )
+
+                if not rows:
+                    break
+
+                ids = [row['id'] for row in rows]
+                vectors = [
+                    EmbeddingCodec.to_vector_literal(EmbeddingCodec.decode(row['chunk_embedding']))
+                    for row in rows
+                ]
+
+                await conn.execute(
+                    """
+                    UPDATE document_chunks dc
+                    SET embedding_vec = v.embedding::vector
+                    FROM unnest($1::int[], $2::text[]) AS v(id, embedding)
+                    WHERE dc.id = v.id
+                    """,
+                    ids, vectors
+                )
+
+        last_id = ids[-1]
+        migrated += len(ids)
+        logger.info(f"Copied {migrated} chunk embeddings into embedding_vec")
+
+        await asyncio.sleep(0)
+
+    logger.info(f"Vector migration finished, {migrated} rows copied")
+    return migrated
+
+MIGRATIONS = {
+    "embeddings": migrate_embeddings,
+    "vectors": migrate_vectors,
+}
+
+async def main(name):
+    try:
+        await init_database()
+        await MIGRATIONS[name]()
+    finally:
+        await close_pool()
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "embeddings"
+    if name not in MIGRATIONS:
+        sys.exit(f"Unknown migration: {name}. Choose from: {', '.join(MIGRATIONS)}")
+    asyncio.run(main(name))
@@ -1,142 +1,772 @@
-import json
-from .connection import get_pool
-from config import topK
-from service.embedding import Embedding
+import asyncio
+import hashlib
+import time
+import numpy as np
+from loguru import logger
+from .connection import acquire, pgvector_features
+from .codec import EmbeddingCodec
+from config import (
+    topK, simi_threshold, searchBackend, embeddingModelId, ftsConfig, lexicalThreshold,
+    pgvectorIndex, pgvectorProbes, hnswEfSearch, pgvectorFilteredSearch, jobStaleAfter, indexDir
+)
+from service.index import ChunkIndex
+from service.metrics import Metrics
+
+# chunks of a document that is still being ingested are only served while its job is alive;
+# a crashed ingest leaves a processing document behind until the job is claimed again
+LIVE_DOCUMENT = f"""(
+    d.status = 'ready'
+    OR EXISTS (
+        SELECT 1 FROM ingest_jobs j
+        WHERE j.document_id = d.id
+          AND j.status = 'running'
+          AND j.updated_at >= CURRENT_TIMESTAMP - make_interval(secs => {int(jobStaleAfter)})
+    )
+)"""
+
+# how many times an index search is repeated without the dead documents it turned up
+INDEX_REFILLS = 3
 
 class DatabaseOperation:
     
     @staticmethod
-    async def insert_doc(filename, file_type, content_type):
-        pool = await get_pool()
-        async with pool.acquire() as conn:
+    def content_hash(data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+    
+    @staticmethod
+    async def insert_doc(filename, file_type, content_type, status="ready", content_hash=None):
+        async with acquire() as conn:
             document_id = await conn.fetchval(
                 """
-                INSERT INTO documents (filename, file_type, content_type)
-                VALUES ($1, $2, $3)
+                INSERT INTO documents (filename, file_type, content_type, status, content_hash)
+                VALUES ($1, $2, $3, $4, $5)
                 RETURNING id
                 """,
-                filename, file_type, content_type
+                filename, file_type, content_type, status, content_hash
             )
             return document_id
           
     @staticmethod
-    async def insert_chunk(document_id, chunk_text, chunk_index, embedding=None):
-        pool = await get_pool()
-        async with pool.acquire() as conn:
+    async def _write_chunks(conn, document_id, chunks, embeddings):
+        records = []
+        for (chunk_index, chunk_text), embedding in zip(chunks, embeddings):
             binary_embedding = None
             if embedding is not None:
-                embedding_list = [float(x) for x in embedding]
-                binary_embedding = json.dumps(embedding_list).encode('utf-8')
-            
-            await conn.execute(
+                binary_embedding = EmbeddingCodec.encode(embedding)
+            records.append((
+                document_id, chunk_text, chunk_index, binary_embedding,
+                DatabaseOperation.content_hash(chunk_text), embeddingModelId
+            ))
+        
+        if searchBackend == "pgvector":
+            # COPY needs a binary codec for every column, which asyncpg lacks for vector
+            await conn.executemany(
                 """
                 INSERT INTO document_chunks 
-                    (document_id, chunk_text, chunk_index, chunk_embedding)
+                    (document_id, chunk_text, chunk_index, chunk_embedding,
+                     chunk_hash, embedding_model, embedding_vec)
                 VALUES 
-                    ($1, $2, $3, $4)
+                    ($1, $2, $3, $4, $5, $6, $7::vector)
                 """,
-                document_id, chunk_text, chunk_index, binary_embedding
+                [
+                    record + (EmbeddingCodec.to_vector_literal(embedding) if embedding is not None else None,)
+                    for record, embedding in zip(records, embeddings)
+                ]
+            )
+        else:
+            await conn.copy_records_to_table(
+                "document_chunks",
+                records=records,
+                columns=[
+                    "document_id", "chunk_text", "chunk_index", "chunk_embedding",
+                    "chunk_hash", "embedding_model"
+                ]
             )
+        
+        await conn.execute(
+            """
+            UPDATE documents
+            SET chunk_count = chunk_count + $2, version = nextval('document_versions')
+            WHERE id = $1
+            """,
+            document_id, len(records)
+        )
+        
+        chunk_indexes = [chunk_index for chunk_index, _ in chunks]
+        rows = await conn.fetch(
+            """
+            SELECT id, chunk_index FROM document_chunks
+            WHERE document_id = $1 AND chunk_index = ANY($2::int[])
+            """,
+            document_id, chunk_indexes
+        )
+        chunk_ids_by_index = {row['chunk_index']: row['id'] for row in rows}
+        return [chunk_ids_by_index[chunk_index] for chunk_index in chunk_indexes]
+    
+    @staticmethod
+    async def insert_chunks(document_id, chunks, embeddings):
+        started = time.perf_counter()
+        
+        async with acquire() as conn:
+            async with conn.transaction():
+                chunk_ids = await DatabaseOperation._write_chunks(conn, document_id, chunks, embeddings)
+        
+        elapsed = time.perf_counter() - started
+        rate = len(chunk_ids) / elapsed if elapsed > 0 else float("inf")
+        logger.debug(f"Stored {len(chunk_ids)} chunks for document {document_id} in {elapsed:.3f}s ({rate:.0f} rows/sec)")
+        return chunk_ids
     
     @staticmethod
-    async def get_doc(document_id):
+    async def store_document(filename, file_type, content_type, chunks, embeddings, content_hash=None):
+        started = time.perf_counter()
+        
+        async with acquire() as conn:
+            async with conn.transaction():
+                document_id = await conn.fetchval(
+                    """
+                    INSERT INTO documents (filename, file_type, content_type, content_hash)
+                    VALUES ($1, $2, $3, $4)
+                    RETURNING id
+                    """,
+                    filename, file_type, content_type, content_hash
+                )
+                
+                chunk_ids = await DatabaseOperation._write_chunks(conn, document_id, chunks, embeddings)
         
-        pool = await get_pool()
-        async with pool.acquire() as conn:
+        elapsed = time.perf_counter() - started
+        rate = len(chunk_ids) / elapsed if elapsed > 0 else float("inf")
+        logger.info(f"Stored {len(chunk_ids)} chunks for document {document_id} in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+        return document_id, chunk_ids
+    
+    @staticmethod
+    async def get_doc_by_hash(content_hash):
+        async with acquire() as conn:
             return await conn.fetchrow(
-                "SELECT * FROM documents WHERE id = $1",
-                document_id
+                """
+                SELECT * FROM documents
+                WHERE content_hash = $1 AND status = 'ready'
+                ORDER BY id
+                LIMIT 1
+                """,
+                content_hash
             )
     
     @staticmethod
-    async def get_all_docs():
-       
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            return await conn.fetch(
-                "SELECT * FROM documents ORDER BY created_at DESC"
+    async def get_embeddings_by_hash(chunk_hashes, embedding_model=embeddingModelId):
+        async with acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT DISTINCT ON (chunk_hash) chunk_hash, chunk_embedding
+                FROM document_chunks
+                WHERE chunk_hash = ANY($1::text[])
+                  AND embedding_model = $2
+                  AND chunk_embedding IS NOT NULL
+                """,
+                list(set(chunk_hashes)), embedding_model
             )
+        return {row['chunk_hash']: EmbeddingCodec.decode(row['chunk_embedding']) for row in rows}
     
     @staticmethod
-    async def doc_selection(document_ids):
-        
-        pool = await get_pool()
-        async with pool.acquire() as conn:
+    async def set_doc_status(document_id, status):
+        async with acquire() as conn:
+            await conn.execute(
+                "UPDATE documents SET status = $2 WHERE id = $1",
+                document_id, status
+            )
+    
+    @staticmethod
+    async def delete_doc(document_id):
+        async with acquire() as conn:
+            await conn.execute("DELETE FROM documents WHERE id = $1", document_id)
+    
+    @staticmethod
+    async def insert_job(filename, file_type, content_type, file_content, batch_id=None):
+        async with acquire() as conn:
+            return await conn.fetchval(
+                """
+                INSERT INTO ingest_jobs (filename, file_type, content_type, file_content, batch_id)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+                """,
+                filename, file_type, content_type, file_content, batch_id
+            )
+    
+    @staticmethod
+    async def insert_jobs(jobs, batch_id=None):
+        # jobs are (filename, content_type, file_content); queued together or not at all
+        async with acquire() as conn:
             async with conn.transaction():
-               
-                await conn.execute("DELETE FROM document_selections")
-                
-               
-                for doc_id in document_ids:
-                    await conn.execute(
+                return [
+                    await conn.fetchval(
                         """
-                        INSERT INTO document_selections (document_id)
-                        VALUES ($1)
+                        INSERT INTO ingest_jobs (filename, file_type, content_type, file_content, batch_id)
+                        VALUES ($1, 'pdf', $2, $3, $4)
+                        RETURNING id
                         """,
-                        doc_id
+                        filename, content_type, file_content, batch_id
                     )
+                    for filename, content_type, file_content in jobs
+                ]
     
     @staticmethod
-    async def get_selected_doc():
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            return await conn.fetch(
+    async def _remove_partial_docs(conn, job_ids):
+        # a worker that died mid-ingest left a processing document; a retry starts over
+        orphans = await conn.fetch(
+            """
+            DELETE FROM documents
+            WHERE status = 'processing'
+              AND id IN (SELECT document_id FROM ingest_jobs WHERE id = ANY($1::int[]))
+            RETURNING id
+            """,
+            job_ids
+        )
+        for orphan in orphans:
+            await ChunkIndex.offload(ChunkIndex.remove_document, orphan['id'])
+            logger.info(f"Removed partial document {orphan['id']}")
+    
+    @staticmethod
+    async def claim_jobs(stale_after, max_attempts, limit=1):
+        async with acquire() as conn:
+            async with conn.transaction():
+                # stale jobs with no attempts left would otherwise report running forever
+                exhausted = await conn.fetch(
+                    """
+                    UPDATE ingest_jobs
+                    SET status = 'failed',
+                        error = 'Gave up after ' || attempts || ' attempts',
+                        file_content = NULL,
+                        updated_at = CURRENT_TIMESTAMP,
+                        finished_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running'
+                      AND attempts >= $2
+                      AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    RETURNING id
+                    """,
+                    stale_after, max_attempts
+                )
+                if exhausted:
+                    job_ids = [job['id'] for job in exhausted]
+                    await DatabaseOperation._remove_partial_docs(conn, job_ids)
+                    logger.warning(f"Ingestion jobs {job_ids} ran out of attempts and were marked failed")
+                
+                # running jobs whose heartbeat stopped belong to a dead worker and are taken over
+                first = await conn.fetchrow(
+                    """
+                    UPDATE ingest_jobs
+                    SET status = 'running',
+                        attempts = attempts + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM ingest_jobs
+                        WHERE attempts < $2
+                          AND (
+                            status = 'queued'
+                            OR (status = 'running'
+                                AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1))
+                          )
+                        ORDER BY id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, attempts, batch_id, filename, file_type, content_type, file_content
+                    """,
+                    stale_after, max_attempts
+                )
+                
+                if first is None:
+                    return []
+                
+                await DatabaseOperation._remove_partial_docs(conn, [first['id']])
+                
+                if first['batch_id'] is None or limit <= 1:
+                    return [first]
+                
+                # files uploaded together are processed together so their chunks share encode batches
+                rest = await conn.fetch(
+                    """
+                    UPDATE ingest_jobs
+                    SET status = 'running',
+                        attempts = attempts + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id IN (
+                        SELECT id FROM ingest_jobs
+                        WHERE batch_id = $1 AND status = 'queued'
+                        ORDER BY id
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, attempts, batch_id, filename, file_type, content_type, file_content
+                    """,
+                    first['batch_id'], limit - 1
+                )
+                return [first] + sorted(rest, key=lambda job: job['id'])
+    
+    @staticmethod
+    async def update_job(job_id, attempt, pages_parsed=None, chunks_embedded=None, chunks_stored=None,
+                         chunks_reused=None, tokens_truncated=None, document_id=None, legacy_tokens_truncated=None):
+        async with acquire() as conn:
+            await conn.execute(
                 """
-                SELECT d.* FROM documents d
-                JOIN document_selections ds ON d.id = ds.document_id
+                UPDATE ingest_jobs
+                SET pages_parsed = COALESCE($2, pages_parsed),
+                    chunks_embedded = COALESCE($3, chunks_embedded),
+                    chunks_stored = COALESCE($4, chunks_stored),
+                    chunks_reused = COALESCE($5, chunks_reused),
+                    tokens_truncated = COALESCE($6, tokens_truncated),
+                    document_id = COALESCE($7, document_id),
+                    legacy_tokens_truncated = COALESCE($9, legacy_tokens_truncated),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = $1 AND attempts = $8 AND status = 'running'
+                """,
+                job_id, pages_parsed, chunks_embedded, chunks_stored, chunks_reused, tokens_truncated,
+                document_id, attempt, legacy_tokens_truncated
+            )
+    
+    @staticmethod
+    async def heartbeat_jobs(jobs):
+        # jobs are (id, attempts) pairs; returns the ids this worker still owns
+        async with acquire() as conn:
+            rows = await conn.fetch(
                 """
+                UPDATE ingest_jobs j
+                SET updated_at = CURRENT_TIMESTAMP
+                FROM unnest($1::int[], $2::int[]) AS owned(id, attempts)
+                WHERE j.id = owned.id AND j.attempts = owned.attempts AND j.status = 'running'
+                RETURNING j.id
+                """,
+                [job_id for job_id, _ in jobs], [attempt for _, attempt in jobs]
             )
+            return {row['id'] for row in rows}
     
     @staticmethod
-    async def similar_chunks_search(query_embedding, limit=topK):
-      
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            selected_docs = await conn.fetch("SELECT document_id FROM document_selections")
-            
-         
-            doc_filter = ""
-            params = []
-            
-            if selected_docs:
-                doc_ids = [row['document_id'] for row in selected_docs]
-                placeholders = ','.join(f'${i+1}' for i in range(len(doc_ids)))
-                doc_filter = f"WHERE dc.document_id IN ({placeholders})"
-                params = doc_ids
+    async def release_job(job_id, attempt):
+        async with acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE ingest_jobs
+                SET status = 'queued',
+                    attempts = GREATEST(attempts - 1, 0),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = $1 AND attempts = $2 AND status = 'running'
+                """,
+                job_id, attempt
+            )
+    
+    @staticmethod
+    async def finish_job(job_id, attempt, status, document_id=None, error=None):
+        async with acquire() as conn:
+            result = await conn.execute(
+                """
+                UPDATE ingest_jobs
+                SET status = $2,
+                    document_id = $3,
+                    error = $4,
+                    file_content = NULL,
+                    updated_at = CURRENT_TIMESTAMP,
+                    finished_at = CURRENT_TIMESTAMP
+                WHERE id = $1 AND attempts = $5 AND status = 'running'
+                """,
+                job_id, status, document_id, error, attempt
+            )
+            # false when another worker took the job over
+            return result == "UPDATE 1"
+    
+    @staticmethod
+    async def get_job(job_id):
+        async with acquire() as conn:
+            return await conn.fetchrow(
+                """
+                SELECT id, filename, status, attempts, pages_parsed, chunks_embedded,
+                       chunks_stored, chunks_reused, tokens_truncated, legacy_tokens_truncated, document_id, error,
+                       created_at, updated_at, finished_at
+                FROM ingest_jobs
+                WHERE id = $1
+                """,
+                job_id
+            )
+    
+    @staticmethod
+    async def get_batch_jobs(batch_id):
+        async with acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT id, filename, status, attempts, pages_parsed, chunks_embedded,
+                       chunks_stored, chunks_reused, tokens_truncated, legacy_tokens_truncated, document_id, error,
+                       created_at, updated_at, finished_at
+                FROM ingest_jobs
+                WHERE batch_id = $1
+                ORDER BY id
+                """,
+                batch_id
+            )
+    
+    @staticmethod
+    async def get_all_docs(limit, after=None, filename_prefix=None, created_from=None, created_to=None):
+        
+        # only the filters in use go into the query, so the planner can walk the (created_at, id) index
+        conditions = []
+        args = []
+        
+        def param(value):
+            args.append(value)
+            return f"${len(args)}"
         
-            query = f"""
-            SELECT 
-                dc.id, 
-                dc.chunk_text, 
-                dc.document_id, 
-                d.filename, 
-                dc.chunk_embedding
-            FROM document_chunks dc
-            JOIN documents d ON dc.document_id = d.id
-            {doc_filter}
+        if after is not None:
+            created_at, document_id = after
+            conditions.append(f"(created_at, id) < ({param(created_at)}, {param(document_id)})")
+        if filename_prefix:
+            escaped = filename_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append(f"filename LIKE {param(escaped + '%')}")
+        if created_from is not None:
+            conditions.append(f"created_at >= {param(created_from)}")
+        if created_to is not None:
+            conditions.append(f"created_at < {param(created_to)}")
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT id, filename, file_type, content_type, status, chunk_count, created_at
+            FROM documents
+            {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT {param(limit)}
             """
-            
-            chunks = await conn.fetch(query, *params)
-            
-            similarities = []
-            for chunk in chunks:
-                if chunk['chunk_embedding'] is None:
-                    continue
-                    
-                chunk_embedding = json.loads(chunk['chunk_embedding'].decode('utf-8'))
+        
+        async with acquire() as conn:
+            return await conn.fetch(query, *args)
+    
+    @staticmethod
+    async def doc_selection(document_ids, selection_id="default"):
+        
+        async with acquire() as conn:
+            async with conn.transaction():
+               
+                await conn.execute(
+                    "DELETE FROM document_selections WHERE selection_id = $1",
+                    selection_id
+                )
                 
-                similarity = await Embedding.calculate_cosine_similarity(
-                    query_embedding, chunk_embedding
+                await conn.execute(
+                    """
+                    INSERT INTO document_selections (selection_id, document_id)
+                    SELECT $1, unnest($2::int[])
+                    ON CONFLICT DO NOTHING
+                    """,
+                    selection_id, list(document_ids)
                 )
-             
-                if similarity > 0:
-                    similarities.append({
-                        'id': chunk['id'],
-                        'chunk_text': chunk['chunk_text'],
-                        'document_id': chunk['document_id'],
-                        'filename': chunk['filename'],
-                        'rank': similarity
-                    })
+    
+    @staticmethod
+    async def get_selection(selection_id="default"):
+        async with acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT document_id FROM document_selections WHERE selection_id = $1",
+                selection_id
+            )
+            return [row['document_id'] for row in rows]
+    
+    @staticmethod
+    async def corpus_version(document_ids=None):
+        # a write raises max(version) and a delete lowers the count, so either changes the result
+        async with acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT count(*) AS documents, COALESCE(max(version), 0) AS version
+                FROM documents
+                WHERE $1::int[] IS NULL OR id = ANY($1::int[])
+                """,
+                DatabaseOperation._id_list(document_ids)
+            )
+            return row['documents'], row['version']
+    
+    @staticmethod
+    async def load_index(batch_size=5000):
+        async with ChunkIndex.lock:
+            if ChunkIndex.loaded:
+                return
+
+            ChunkIndex.begin_load()
+            try:
+                fresh = await asyncio.to_thread(ChunkIndex.claim)
+
+                async with acquire() as conn:
+                    missing = None
+                    if not fresh:
+                        missing = await DatabaseOperation.reconcile_index(conn)
+                        if not missing:
+                            ChunkIndex.finish_load()
+                            return
+
+                    async with conn.transaction():
+                        chunk_ids, document_ids, embeddings = [], [], []
+                        async for row in conn.cursor(
+                            """
+                            SELECT id, document_id, chunk_embedding
+                            FROM document_chunks
+                            WHERE chunk_embedding IS NOT NULL
+                              AND ($1::int[] IS NULL OR id = ANY($1::int[]))
+                            ORDER BY id
+                            """,
+                            missing,
+                            prefetch=batch_size
+                        ):
+                            chunk_ids.append(row['id'])
+                            document_ids.append(row['document_id'])
+                            embeddings.append(EmbeddingCodec.decode(row['chunk_embedding']))
+
+                            if len(chunk_ids) >= batch_size:
+                                ChunkIndex.load_batch(chunk_ids, document_ids, embeddings)
+                                chunk_ids, document_ids, embeddings = [], [], []
+
+                        ChunkIndex.load_batch(chunk_ids, document_ids, embeddings)
+            except Exception:
+                ChunkIndex.abort_load()
+                raise
+
+            ChunkIndex.finish_load()
+
+    @staticmethod
+    async def reconcile_index(conn):
+        # an indexDir left by an earlier run can be behind the database: chunks stored and documents
+        # deleted while no process had it open, or by an instance that doesn't share it. Deleted
+        # documents get tombstones and the ids of chunks it lacks are returned to be loaded
+        stored_ids, stored_documents = ChunkIndex.stored()
+
+        rows = await conn.fetch(
+            "SELECT id FROM documents WHERE id = ANY($1::int[])",
+            stored_documents.tolist()
+        )
+        gone = np.setdiff1d(stored_documents, [row['id'] for row in rows])
+        ChunkIndex.removed.extend(gone.tolist())
+
+        rows = await conn.fetch("SELECT id FROM document_chunks WHERE chunk_embedding IS NOT NULL")
+        missing = np.setdiff1d([row['id'] for row in rows], stored_ids).tolist()
+
+        if len(gone) or missing:
+            logger.info(f"Index at {indexDir} was missing {len(missing)} chunks and {len(gone)} deletions")
+        return missing
+
+    @staticmethod
+    async def catch_up_index():
+        # chunks stored by other workers or instances; the ones this process stored are already indexed
+        if not ChunkIndex.catch_up_due():
+            return
+
+        async with ChunkIndex.lock:
+            if not ChunkIndex.loaded:
+                return
+            floor = ChunkIndex.catch_up_floor()
+
+            async with acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT id FROM document_chunks WHERE id > $1 AND chunk_embedding IS NOT NULL",
+                    floor
+                )
+                chunk_ids = [row['id'] for row in rows]
+                ChunkIndex.mark(max(chunk_ids, default=floor))
+                if not chunk_ids:
+                    return
+
+                with ChunkIndex.catching_up() as ready:
+                    if not ready:
+                        return
+                    missing = ChunkIndex.unknown(chunk_ids, floor)
+                    if not len(missing):
+                        return
+
+                    rows = await conn.fetch(
+                        """
+                        SELECT id, document_id, chunk_embedding
+                        FROM document_chunks
+                        WHERE id = ANY($1::int[])
+                        ORDER BY id
+                        """,
+                        missing.tolist()
+                    )
+                    await ChunkIndex.offload(
+                        ChunkIndex.load_batch,
+                        [row['id'] for row in rows],
+                        [row['document_id'] for row in rows],
+                        [EmbeddingCodec.decode(row['chunk_embedding']) for row in rows]
+                    )
+                    logger.info(f"Chunk index caught up on {len(rows)} chunks stored elsewhere")
+
+    @staticmethod
+    def _id_list(document_ids):
+        if document_ids is None:
+            return None
+        return [int(document_id) for document_id in document_ids]
+
+    @staticmethod
+    async def similar_chunks_search(query_embedding, limit=topK, document_ids=None):
+        if searchBackend == "pgvector":
+            return await DatabaseOperation.pgvector_chunks_search(query_embedding, limit, document_ids)
+        return await DatabaseOperation.index_chunks_search(query_embedding, limit, document_ids)
+
+    @staticmethod
+    async def lexical_chunks_search(question, limit=topK, document_ids=None):
+        
+        async with acquire() as conn:
+            chunks = await Metrics.timed("query", "lexical_search", conn.fetch(
+                f"""
+                SELECT 
+                    dc.id, 
+                    dc.chunk_text, 
+                    dc.document_id, 
+                    dc.chunk_index,
+                    d.filename,
+                    ts_rank_cd(dc.chunk_tsv, q) AS rank
+                FROM document_chunks dc
+                JOIN documents d ON dc.document_id = d.id,
+                     websearch_to_tsquery($2::regconfig, $1) q
+                WHERE dc.chunk_tsv @@ q
+                  AND ts_rank_cd(dc.chunk_tsv, q) >= $5
+                  AND ($4::int[] IS NULL OR dc.document_id = ANY($4::int[]))
+                  AND {LIVE_DOCUMENT}
+                ORDER BY rank DESC
+                LIMIT $3
+                """,
+                question, ftsConfig, limit, DatabaseOperation._id_list(document_ids), lexicalThreshold
+            ))
+            
+            return [
+                {
+                    'id': chunk['id'],
+                    'chunk_text': chunk['chunk_text'],
+                    'document_id': chunk['document_id'],
+                    'chunk_index': chunk['chunk_index'],
+                    'filename': chunk['filename'],
+                    'rank': chunk['rank']
+                }
+                for chunk in chunks
+            ]
+    
+    @staticmethod
+    async def pgvector_chunks_search(query_embedding, limit=topK, document_ids=None):
+
+        async with acquire() as conn:
+            async with conn.transaction():
+                if pgvectorIndex == "ivfflat":
+                    await conn.execute(f"SET LOCAL ivfflat.probes = {int(pgvectorProbes)}")
+                else:
+                    await conn.execute(f"SET LOCAL hnsw.ef_search = {int(hnswEfSearch)}")
                 
-            similarities.sort(key=lambda x: x['rank'], reverse=True)
-            return similarities[:limit]
\ No newline at end of file
+                # the index yields its ef_search/probes nearest rows and the WHERE clause filters
+                # those afterwards, so a small selection can leave fewer than limit rows, or none
+                if pgvectorFilteredSearch == "iterative" and pgvector_features["iterative_scan"]:
+                    # keep scanning the index until limit rows pass the filters
+                    await conn.execute(f"SET LOCAL {pgvectorIndex}.iterative_scan = relaxed_order")
+                elif document_ids:
+                    # no index: filter first, then rank every selected chunk exactly
+                    await conn.execute("SET LOCAL enable_indexscan = off")
+
+                chunks = await Metrics.timed("query", "vector_search", conn.fetch(
+                    f"""
+                    SELECT * FROM (
+                        SELECT 
+                            dc.id, 
+                            dc.chunk_text, 
+                            dc.document_id, 
+                            dc.chunk_index,
+                            d.filename,
+                            1 - (dc.embedding_vec <=> $1::vector) AS rank
+                        FROM document_chunks dc
+                        JOIN documents d ON dc.document_id = d.id
+                        WHERE dc.embedding_vec IS NOT NULL
+                          AND ($4::int[] IS NULL OR dc.document_id = ANY($4::int[]))
+                          AND {LIVE_DOCUMENT}
+                        ORDER BY dc.embedding_vec <=> $1::vector
+                        LIMIT $2
+                    ) ranked
+                    WHERE rank >= $3
+                    ORDER BY rank DESC
+                    """,
+                    EmbeddingCodec.to_vector_literal(query_embedding), limit, simi_threshold,
+                    DatabaseOperation._id_list(document_ids)
+                ))
+
+            return [
+                {
+                    'id': chunk['id'],
+                    'chunk_text': chunk['chunk_text'],
+                    'document_id': chunk['document_id'],
+                    'chunk_index': chunk['chunk_index'],
+                    'filename': chunk['filename'],
+                    'rank': chunk['rank']
+                }
+                for chunk in chunks
+            ]
+
+    @staticmethod
+    async def index_chunks_search(query_embedding, limit=topK, document_ids=None):
+
+        if not ChunkIndex.loaded:
+            await DatabaseOperation.load_index()
+        await DatabaseOperation.catch_up_index()
+
+        # other processes' deletes and stalled ingests are only seen here, when their chunks come back
+        # from the index; their documents are masked and the top-k is taken again
+        excluded = set()
+        async with acquire() as conn:
+            for _ in range(INDEX_REFILLS + 1):
+                with Metrics.stage("query", "score"):
+                    chunk_ids, scores = ChunkIndex.search(query_embedding, document_ids, limit, excluded=excluded)
+                if len(chunk_ids) == 0:
+                    return []
+
+                chunks = await Metrics.timed("query", "fetch", conn.fetch(
+                    f"""
+                    SELECT 
+                        dc.id, 
+                        dc.chunk_text, 
+                        dc.document_id, 
+                        dc.chunk_index,
+                        d.filename,
+                        dc.chunk_embedding,
+                        {LIVE_DOCUMENT} AS live
+                    FROM document_chunks dc
+                    JOIN documents d ON dc.document_id = d.id
+                    WHERE dc.id = ANY($1::int[])
+                    """,
+                    chunk_ids.tolist()
+                ))
+
+                # deleted chunks never come back, so the index forgets their documents for good
+                found = {chunk['id'] for chunk in chunks}
+                gone = [chunk_id for chunk_id in chunk_ids.tolist() if chunk_id not in found]
+                stalled = {chunk['document_id'] for chunk in chunks if not chunk['live']}
+                for document_id in ChunkIndex.documents(gone).tolist():
+                    await ChunkIndex.offload(ChunkIndex.remove_document, document_id)
+                    excluded.add(document_id)
+                if not gone and not stalled:
+                    break
+                excluded |= stalled
+
+            chunks_by_id = {chunk['id']: chunk for chunk in chunks if chunk['live']}
+
+            if ChunkIndex.quantization != "none":
+                # the shortlist came from quantized codes; rank it again at full precision
+                candidates = [chunks_by_id[chunk_id] for chunk_id in chunk_ids.tolist() if chunk_id in chunks_by_id]
+                with Metrics.stage("query", "rescore"):
+                    chunk_ids, scores = ChunkIndex.rescore(
+                        query_embedding,
+                        [chunk['id'] for chunk in candidates],
+                        [EmbeddingCodec.decode(chunk['chunk_embedding']) for chunk in candidates],
+                        limit
+                    )
+
+            similarities = []
+            for chunk_id, similarity in zip(chunk_ids.tolist(), scores.tolist()):
+                chunk = chunks_by_id.get(chunk_id)
+                if chunk is None:
+                    continue
+                similarities.append({
+                    'id': chunk['id'],
+                    'chunk_text': chunk['chunk_text'],
+                    'document_id': chunk['document_id'],
+                    'chunk_index': chunk['chunk_index'],
+                    'filename': chunk['filename'],
+                    'rank': similarity
+                })
+
+            return similarities
@@ -1,13 +1,27 @@
+import asyncio
+import time
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import sys
 from loguru import logger
 
-from database.connection import init_database, close_pool
+from database.connection import init_database, close_pool, ping
+from database.operations import DatabaseOperation
+from database.migrate import migrate_embeddings
 from service.embedding import Embedding
+from service.executor import Executor
+from service.index import ChunkIndex
+from service.jobs import IngestWorkers
+from service.llm import LLM
+from service.metrics import Metrics
 from api.doc_route import router as document_router
 from api.qa import router as qa_router
+from config import (
+    migrateOnStartup, searchBackend, serverTiming, warmupOnStartup, startupRetries, startupRetryDelay
+)
+
+started = time.perf_counter()
 
 
 logger.remove()
@@ -28,24 +42,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    if not serverTiming:
+        return await call_next(request)
+    
+    Metrics.collect()
+    response = await call_next(request)
+    header = Metrics.server_timing()
+    if header:
+        response.headers["Server-Timing"] = header
+    return response
+
 app.include_router(document_router)
 app.include_router(qa_router)
 
+background_tasks = set()
+startup_state = {"database": False, "ready": False, "error": None}
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def prepare():
+    await init_database()
+    startup_state["database"] = True
+    if not IngestWorkers.tasks:
+        IngestWorkers.start()
+    
+    # the model and the index load side by side; neither needs the other
+    steps = [Embedding.warm_up() if warmupOnStartup else asyncio.to_thread(Embedding.get_model)]
+    if searchBackend == "memory":
+        steps.append(DatabaseOperation.load_index())
+    await asyncio.gather(*steps)
+    logger.info("Embedding model loaded successfully")
+    
+    if migrateOnStartup:
+        run_in_background(migrate_embeddings())
+
+async def prepare_with_retries():
+    # the database may still be starting alongside the app; each step is safe to run again
+    delay = startupRetryDelay
+    for attempt in range(startupRetries + 1):
+        try:
+            await prepare()
+            break
+        except Exception as e:
+            if attempt == startupRetries:
+                # /healthz turns 503 so the process gets restarted rather than left unready
+                startup_state["error"] = str(e)
+                logger.error(f"Error during startup, giving up after {attempt + 1} attempts: {e}")
+                return
+            logger.warning(f"Error during startup, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+    
+    startup_state["ready"] = True
+    logger.info(f"Application ready {time.perf_counter() - started:.2f}s after start")
+
 @app.on_event("startup")
 async def startup():
-    try:
-        await init_database()
-            
-        i = Embedding.get_model()
-        logger.info("Embedding model loaded successfully")
-        
-        logger.info("Application started successfully")
-    except Exception as e:
-        logger.error(f"Error during startup: {e}")
-        sys.exit(1)
+    await LLM.open_session()
+    
+    # the server starts listening straight away; /readyz reports when the slow parts are done
+    run_in_background(prepare_with_retries())
+    logger.info(f"Application listening {time.perf_counter() - started:.2f}s after start")
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in list(background_tasks):
+        task.cancel()
+    await IngestWorkers.stop()
+    Executor.shutdown()
+    await LLM.close_session()
     await close_pool()
     logger.info("shut down")
 
@@ -65,6 +136,30 @@ async def root():
         "docs_url": "/docs"
     }
 
+@app.get("/healthz")
+async def healthz():
+    if startup_state["error"]:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup_state["error"]})
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    checks = {
+        "database": startup_state["database"] and await ping(),
+        "model": Embedding.is_loaded(),
+        "index": searchBackend != "memory" or ChunkIndex.loaded,
+        "startup": startup_state["ready"]
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "checks": checks}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    return Response(Metrics.export(), media_type=Metrics.content_type)
+
 # @app.get("/check")
 # async def Check():
 #     try:
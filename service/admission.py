@@ -0,0 +1,114 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from loguru import logger
+from config import llmConcurrency, llmQueueDepth, llmQueueTimeout
+from .metrics import Metrics
+
+# assumed length of one generation until the first real one finishes
+COLD_START_SECONDS = 5.0
+
+class Overloaded(Exception):
+
+    def __init__(self, status_code, retry_after, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class SingleFlight:
+
+    # identical requests that arrive while one is running wait for its result instead of repeating it
+    def __init__(self):
+        self.flights = {}
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.flights[key] = task
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+        else:
+            self.coalesced += 1
+            Metrics.coalesced.inc()
+
+        # a client that disconnects stops waiting, but the generation runs on for the others and the cache
+        return await asyncio.shield(task)
+
+class Admission:
+
+    # at most `limit` generations run at once; up to `queue_depth` more wait, each for at most
+    # `queue_timeout` seconds, and anything beyond that is turned away immediately
+    def __init__(self, limit=llmConcurrency, queue_depth=llmQueueDepth, queue_timeout=llmQueueTimeout):
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        # running average of one generation, for Retry-After
+        self.average = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self):
+        average = COLD_START_SECONDS if self.average is None else self.average
+        estimate = math.ceil(average * (self.waiting + 1) / self.limit)
+        # after queue_timeout every current waiter has either been admitted or given up
+        return max(1, min(estimate, math.ceil(self.queue_timeout)))
+
+    def full(self):
+        # waiting counts callers that have not been handed their slot yet, including free ones
+        return self.active + self.waiting >= self.limit + self.queue_depth
+
+    def reject(self):
+        self.rejected += 1
+        Metrics.admission.labels("rejected").inc()
+        retry_after = self.retry_after()
+        logger.debug(f"LLM queue full ({self.waiting} waiting), retry after {retry_after}s")
+        return Overloaded(429, retry_after, "Too many questions in progress, try again later")
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.full():
+            raise self.reject()
+
+        self.waiting += 1
+        Metrics.llm_waiting.inc()
+        try:
+            with Metrics.stage("query", "llm_queue"):
+                await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            Metrics.admission.labels("timed_out").inc()
+            logger.warning(f"Waited {self.queue_timeout}s for an LLM slot, giving up")
+            raise Overloaded(503, self.retry_after(), "The answer service is overloaded, try again later")
+        finally:
+            self.waiting -= 1
+            Metrics.llm_waiting.dec()
+
+        self.active += 1
+        self.admitted += 1
+        Metrics.admission.labels("admitted").inc()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+            elapsed = time.perf_counter() - started
+            self.average = elapsed if self.average is None else 0.8 * self.average + 0.2 * elapsed
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue_depth": self.queue_depth,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "average_seconds": self.average,
+        }
@@ -0,0 +1,110 @@
+import hashlib
+import numpy as np
+from loguru import logger
+from .cache import LRUCache
+from .embedding import Embedding
+from database.operations import DatabaseOperation
+from config import embeddingModelId, answerCacheMB, answerCacheTTL, answerCacheThreshold, answerCacheEntries
+
+class AnswerBucket:
+
+    # the answers for one document set at one corpus version; replaced on every store, never edited
+    def __init__(self, embeddings, entries):
+        self.embeddings = embeddings
+        self.entries = entries
+        self.nbytes = embeddings.nbytes + sum(
+            len(question) + len(answer) + 100 * len(sources) + 200
+            for question, answer, sources in entries
+        )
+
+class AnswerCache:
+
+    cache = LRUCache(
+        answerCacheMB * 1024 * 1024,
+        ttl=answerCacheTTL,
+        sizeof=lambda key, bucket: bucket.nbytes + 200
+    )
+    hits = 0
+    misses = 0
+    bypassed = 0
+
+    @staticmethod
+    def enabled():
+        # paraphrases are matched on the question embedding, so there is nothing to match without the model
+        return answerCacheMB > 0 and Embedding.is_loaded()
+
+    @staticmethod
+    async def key(document_ids):
+        # keyed on the resolved documents, not the selection name, and on their current version, so
+        # any chunk write or delete in the selection moves lookups to a fresh bucket
+        documents, version = await DatabaseOperation.corpus_version(document_ids)
+        selection = hashlib.sha1(document_ids.tobytes() if document_ids is not None else b"").hexdigest()
+        return embeddingModelId, selection, documents, version
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @classmethod
+    async def lookup(cls, question, document_ids, use_cache=True):
+        # returns the cached (answer, sources) or None, and a ticket to store the fresh answer under
+        if not cls.enabled():
+            return None, None
+
+        embedding = await Embedding.generate_Embedding(question)
+        if not embedding:
+            return None, None
+
+        key = await cls.key(document_ids)
+        ticket = (key, cls._unit(embedding))
+        if not use_cache:
+            cls.bypassed += 1
+            return None, ticket
+
+        bucket = cls.cache.get(key)
+        if bucket is not None:
+            scores = bucket.embeddings @ ticket[1]
+            best = int(np.argmax(scores))
+            if scores[best] >= answerCacheThreshold:
+                cls.hits += 1
+                logger.info(f"Answer cache hit (similarity {scores[best]:.4f})")
+                _, answer, sources = bucket.entries[best]
+                return (answer, sources), ticket
+
+        cls.misses += 1
+        return None, ticket
+
+    @classmethod
+    def store(cls, ticket, question, answer, sources):
+        if ticket is None:
+            return
+        key, embedding = ticket
+
+        embeddings = np.empty((0, len(embedding)), dtype=np.float32)
+        entries = []
+        bucket = cls.cache.peek(key)
+        if bucket is not None:
+            embeddings, entries = bucket.embeddings, bucket.entries
+            # a refreshed answer replaces the one it would have matched
+            keep = embeddings @ embedding < answerCacheThreshold
+            embeddings = embeddings[keep]
+            entries = [entry for entry, kept in zip(entries, keep) if kept]
+
+        embeddings = np.vstack([embeddings, embedding[None, :]])[-answerCacheEntries:]
+        entries = (entries + [(question, answer, sources)])[-answerCacheEntries:]
+        cls.cache.put(key, AnswerBucket(embeddings, entries))
+
+    @classmethod
+    def stats(cls):
+        stats = cls.cache.stats()
+        lookups = cls.hits + cls.misses
+        stats.update({
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "bypassed": cls.bypassed,
+            "hit_rate": cls.hits / lookups if lookups else 0.0,
+            "threshold": answerCacheThreshold,
+        })
+        return stats
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import numpy as np
+from loguru import logger
+from config import embeddingBackend, embeddingMod, embeddingModelDir, embeddingBatchSize, embeddingThreads, embeddingDim
+
+class EmbeddingBackend:
+
+    name = None
+
+    def __init__(self, batch_size=embeddingBatchSize):
+        self.batch_size = batch_size
+
+    def get_sentence_embedding_dimension(self):
+        raise NotImplementedError
+
+    def encode_batch(self, texts):
+        raise NotImplementedError
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # batches of similar length pad less; results go back in the caller's order
+        order = sorted(range(len(texts)), key=lambda position: len(texts[position]))
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            embeddings[positions] = self.encode_batch([texts[position] for position in positions])
+        return embeddings
+
+class SentenceTransformerBackend(EmbeddingBackend):
+
+    name = "sentence-transformers"
+    device = None
+
+    def __init__(self, model_name=embeddingMod, batch_size=embeddingBatchSize, threads=embeddingThreads):
+        super().__init__(batch_size)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device=self.device)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, **kwargs):
+        # sentence-transformers already sorts each call by length
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+
+class QuantizedTorchBackend(SentenceTransformerBackend):
+
+    name = "torch-int8"
+    # dynamic quantization only has CPU kernels
+    device = "cpu"
+
+    def __init__(self, model_name=embeddingModelDir or embeddingMod, batch_size=embeddingBatchSize, threads=embeddingThreads):
+        super().__init__(model_name, batch_size, threads)
+        import torch
+
+        # int8 weights for every Linear layer, activations quantized on the fly
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxBackend(EmbeddingBackend):
+
+    name = "onnx"
+
+    def __init__(self, model_dir=embeddingModelDir, batch_size=embeddingBatchSize, threads=embeddingThreads):
+        super().__init__(batch_size)
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        if not model_dir:
+            raise ValueError("embeddingBackend=onnx needs embeddingModelDir")
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(path):
+            path = os.path.join(model_dir, "onnx", "model.onnx")
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.inputs = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        feed = {name: value.astype(np.int64) for name, value in tokens.items() if name in self.inputs}
+        hidden = self.session.run(None, feed)[0]
+
+        # mean pooling over real tokens, then unit length, as the sentence-transformers pipeline does
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+class HashBackend(EmbeddingBackend):
+
+    name = "hash"
+
+    # same text, same unit vector, no model download; for tests and benchmarks only
+    def __init__(self, dimension=embeddingDim, batch_size=embeddingBatchSize):
+        super().__init__(batch_size)
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode_batch(self, texts):
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimension)
+            vectors[row] = vector / np.linalg.norm(vector)
+        return vectors
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (SentenceTransformerBackend, QuantizedTorchBackend, OnnxBackend, HashBackend)
+}
+
+def load_backend(name=embeddingBackend):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embeddingBackend: {name} (expected one of {', '.join(BACKENDS)})")
+    logger.info(f"Loading {name} embedding backend")
+    return BACKENDS[name]()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+
+    def __init__(self, max_bytes, ttl=0, sizeof=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda key, value: 1)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires = entry
+            if expires and expires < time.monotonic():
+                del self.entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        # no effect on recency or the hit counters
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (entry[2] and entry[2] < time.monotonic()):
+                return None
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(key, value)
+        if size > self.max_bytes:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl else 0
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+
+            self.entries[key] = (value, size, expires)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
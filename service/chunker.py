@@ -0,0 +1,191 @@
+import json
+import os
+import re
+from loguru import logger
+from config import (
+    chunker, chunkSize, chunkOver, chunkTokens, chunkOverlapTokens,
+    embeddingBackend, embeddingModelSource
+)
+
+PARAGRAPH = re.compile(r"\n\s*\n")
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+# transformers reports "no limit" as a huge model_max_length
+UNBOUNDED = 1_000_000
+
+def max_sequence_length(name, model):
+    # sentence-transformers models often encode less than their tokenizer allows (256 of 512 for MiniLM)
+    try:
+        if os.path.isdir(name):
+            path = os.path.join(name, "sentence_bert_config.json")
+        else:
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(name, "sentence_bert_config.json")
+        with open(path) as f:
+            return int(json.load(f)["max_seq_length"])
+    except Exception:
+        limit = model.model_max_length
+        return limit if limit < UNBOUNDED else None
+
+class Tokenizer:
+
+    # counts in the embedding model's word pieces; the hash backend has no model, so it counts words
+    def __init__(self, name=None):
+        self.model = None
+        self.special = 0
+        # tokens the encoder keeps, special tokens included; None when unknown
+        self.max_tokens = None
+        if name:
+            from transformers import AutoTokenizer
+            self.model = AutoTokenizer.from_pretrained(name)
+            self.special = self.model.num_special_tokens_to_add()
+            self.max_tokens = max_sequence_length(name, self.model)
+
+    def spans(self, texts):
+        if not texts:
+            return []
+        if self.model is None:
+            return [[match.span() for match in WORD.finditer(text)] for text in texts]
+        encoded = self.model(texts, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return encoded["offset_mapping"]
+
+    def count(self, texts):
+        return [len(spans) + self.special for spans in self.spans(texts)]
+
+class TokenChunker:
+
+    def __init__(self, tokenizer, max_tokens=chunkTokens, overlap_tokens=chunkOverlapTokens):
+        self.tokenizer = tokenizer
+        self.limit = max_tokens - tokenizer.special
+        self.overlap = min(overlap_tokens, self.limit // 2)
+
+    def units(self, text):
+        # sentences tagged with whether they open a paragraph; anything longer than a chunk is cut on token bounds
+        sentences = []
+        for paragraph in PARAGRAPH.split(text):
+            for position, sentence in enumerate(SENTENCE.split(paragraph.strip())):
+                sentence = " ".join(sentence.split())
+                if sentence:
+                    sentences.append((sentence, position == 0))
+
+        units = []
+        for (sentence, opens), spans in zip(sentences, self.tokenizer.spans([s for s, _ in sentences])):
+            if len(spans) <= self.limit:
+                units.append((sentence, len(spans), opens))
+                continue
+            for start in range(0, len(spans), self.limit):
+                window = spans[start:start + self.limit]
+                units.append((sentence[window[0][0]:window[-1][1]], len(window), opens and start == 0))
+        return units
+
+    @staticmethod
+    def join(units):
+        text = ""
+        for sentence, _, opens in units:
+            if text:
+                text += "\n\n" if opens else " "
+            text += sentence
+        return text
+
+    def split_text(self, text):
+        # one pass over the sentences; each is tokenized once and chunks are packed greedily
+        chunks = []
+        current = []
+        size = 0
+
+        for unit in self.units(text):
+            tokens = unit[1]
+            if current and size + tokens > self.limit:
+                chunks.append((self.join(current), size))
+
+                carry = []
+                carried = 0
+                for previous in reversed(current):
+                    if carried + previous[1] > self.overlap:
+                        break
+                    carry.append(previous)
+                    carried += previous[1]
+                current, size = carry[::-1], carried
+                if size + tokens > self.limit:
+                    current, size = [], 0
+
+            current.append(unit)
+            size += tokens
+
+        if current:
+            chunks.append((self.join(current), size))
+        return chunks
+
+class Chunker:
+
+    tokenizer = None
+    splitter = None
+    characters = None
+
+    @classmethod
+    def get_tokenizer(cls):
+        if cls.tokenizer is None:
+            if embeddingBackend == "hash":
+                cls.tokenizer = Tokenizer()
+                return cls.tokenizer
+            # words undercount word pieces, so chunks would overrun the model and truncation would go
+            # unreported; the ingest fails instead, and the next one tries to load the tokenizer again
+            try:
+                cls.tokenizer = Tokenizer(embeddingModelSource)
+            except Exception as e:
+                logger.error(f"Could not load tokenizer {embeddingModelSource}: {e}")
+                raise RuntimeError(f"Could not load the tokenizer for {embeddingModelSource}: {e}") from e
+        return cls.tokenizer
+
+    @classmethod
+    def model_limit(cls):
+        # without a known encoder limit, chunkTokens stands in for it
+        return cls.get_tokenizer().max_tokens or chunkTokens
+
+    @classmethod
+    def get_character_splitter(cls):
+        if cls.characters is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            cls.characters = RecursiveCharacterTextSplitter(
+                chunk_size=chunkSize,
+                chunk_overlap=chunkOver,
+                separators=["\n\n", "\n", " ", ""]
+            )
+        return cls.characters
+
+    @classmethod
+    def get_splitter(cls):
+        if cls.splitter is None:
+            if chunker == "tokens":
+                limit = cls.model_limit()
+                if chunkTokens > limit:
+                    logger.warning(
+                        f"chunkTokens={chunkTokens} is above the {limit} tokens {embeddingModelSource} encodes, "
+                        f"chunks are capped at {limit}"
+                    )
+                cls.splitter = TokenChunker(cls.get_tokenizer(), max_tokens=min(chunkTokens, limit))
+            else:
+                cls.splitter = cls.get_character_splitter()
+        return cls.splitter
+
+    @classmethod
+    def truncation(cls, chunks):
+        # tokens of the chunks the model sees, and the tokens past its limit that it drops
+        counts = cls.get_tokenizer().count(chunks)
+        limit = cls.model_limit()
+        truncated = sum(max(0, count - limit) for count in counts)
+        return sum(counts) - truncated, truncated
+
+    @classmethod
+    def split(cls, text):
+        # returns the chunks, the tokens the model will see and the tokens it will cut off, then the
+        # tokens it would cut off from the character splitter's chunks, for comparison
+        splitter = cls.get_splitter()
+        if isinstance(splitter, TokenChunker):
+            chunks = splitter.split_text(text)
+            _, legacy = cls.truncation(cls.get_character_splitter().split_text(text))
+            return [chunk for chunk, _ in chunks], sum(size for _, size in chunks), 0, legacy
+
+        chunks = splitter.split_text(text)
+        embedded, truncated = cls.truncation(chunks)
+        return chunks, embedded, truncated, truncated
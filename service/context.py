@@ -0,0 +1,93 @@
+from loguru import logger
+from config import contextTokens, charsPerToken, chunkOver, chunker, chunkOverlapTokens
+from .metrics import Metrics
+
+MIN_OVERLAP = 16
+# the token chunker repeats whole sentences of up to chunkOverlapTokens tokens
+MAX_OVERLAP = chunkOver if chunker == "characters" else chunkOverlapTokens * 16
+
+class ContextBuilder:
+
+    @staticmethod
+    def estimate_tokens(text):
+        return -(-len(text) // charsPerToken)
+
+    @staticmethod
+    def overlap(previous, following):
+        # the splitter repeats the end of one chunk at the start of the next
+        longest = min(len(previous), len(following), MAX_OVERLAP)
+        for size in range(longest, MIN_OVERLAP - 1, -1):
+            if previous.endswith(following[:size]):
+                return size
+        return 0
+
+    @staticmethod
+    def merge(chunks):
+        # runs of consecutive chunks from one document become a single passage, ranked by its best chunk
+        positions = {chunk['id']: position for position, chunk in enumerate(chunks)}
+        ordered = sorted(chunks, key=lambda chunk: (chunk['document_id'], chunk['chunk_index']))
+
+        passages = []
+        seen = set()
+        for chunk in ordered:
+            text = chunk['chunk_text']
+            if text in seen:
+                continue
+            seen.add(text)
+
+            last = passages[-1] if passages else None
+            if (
+                last is not None
+                and last['document_id'] == chunk['document_id']
+                and last['last_index'] + 1 == chunk['chunk_index']
+            ):
+                overlap = ContextBuilder.overlap(last['text'], text)
+                last['text'] += text[overlap:] if overlap else "\n" + text
+                last['last_index'] = chunk['chunk_index']
+                last['chunks'].append(chunk)
+                last['position'] = min(last['position'], positions[chunk['id']])
+                continue
+
+            passages.append({
+                'document_id': chunk['document_id'],
+                'last_index': chunk['chunk_index'],
+                'text': text,
+                'chunks': [chunk],
+                'position': positions[chunk['id']]
+            })
+
+        return sorted(passages, key=lambda passage: passage['position'])
+
+    @staticmethod
+    def build(chunks, budget=contextTokens):
+        passages = ContextBuilder.merge(chunks)
+
+        parts = []
+        used = []
+        remaining = budget
+        for passage in passages:
+            tokens = ContextBuilder.estimate_tokens(passage['text'])
+            if tokens <= remaining:
+                parts.append(passage['text'])
+                used.extend(passage['chunks'])
+                remaining -= tokens
+            elif not parts:
+                # the best passage alone is over budget; keep as much of it as fits
+                parts.append(passage['text'][:budget * charsPerToken])
+                used.extend(passage['chunks'])
+                remaining = 0
+
+        context = "\n\n".join(parts)
+
+        raw_tokens = sum(ContextBuilder.estimate_tokens(chunk['chunk_text']) for chunk in chunks)
+        packed_tokens = ContextBuilder.estimate_tokens(context)
+        Metrics.context_tokens.labels("retrieved").inc(raw_tokens)
+        Metrics.context_tokens.labels("packed").inc(packed_tokens)
+        logger.info(
+            f"Context packed {len(chunks)} chunks into {len(parts)} passages, "
+            f"~{packed_tokens} tokens (~{raw_tokens - packed_tokens} saved, budget {budget})"
+        )
+
+        order = {chunk['id']: position for position, chunk in enumerate(chunks)}
+        used.sort(key=lambda chunk: order[chunk['id']])
+        return context, used
@@ -1,44 +1,114 @@
+import asyncio
 import os
 import tempfile
 import sys
 from loguru import logger
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import chunkSize, chunkOver
+from config import pageBatch, parseWorkers
+from service.executor import Executor
+from service.metrics import Metrics
+
+def spool_pdf(file_content):
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    try:
+        temp_file.write(file_content)
+    finally:
+        temp_file.close()
+    return temp_file.name
+
+# pypdf, langchain and the tokenizer are imported inside the worker functions, which run in
+# the parse processes, so importing this module stays cheap for the API process
+
+def count_pages(path):
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def split_pages(path, start, stop):
+    from pypdf import PdfReader
+    from service.chunker import Chunker
+
+    # pypdf reads only the objects each page needs, so a window stays small however big the file is
+    reader = PdfReader(path)
+
+    chunks = []
+    tokens = 0
+    truncated = 0
+    legacy = 0
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        page_chunks, page_tokens, page_truncated, page_legacy = Chunker.split(text)
+        chunks.extend(page_chunks)
+        tokens += page_tokens
+        truncated += page_truncated
+        legacy += page_legacy
+    return chunks, tokens, truncated, legacy
 
 class Processor:
-    
+
     @staticmethod
-    async def doc_process(file_content, file_type):
+    async def stream_chunks(file_content, file_type, progress=None):
         if file_type.lower() != 'pdf':
             raise ValueError(f"Only PDF are supported. Got: {file_type}")
-      
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        temp_file.write(file_content)
-        temp_file.close()
-        temp_file_path = temp_file.name
-
-        loader = PyPDFLoader(temp_file_path)
-        documents = loader.load()
-        
-        os.unlink(temp_file_path)
-        
-       
-        if not documents:
-            logger.warning("No content")
-            return []
-       
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunkSize,
-            chunk_overlap=chunkOver,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        
-        chunks = text_splitter.split_documents(documents)
-        
-     
-        result = [(i, chunk.page_content) for i, chunk in enumerate(chunks)]
-        
-        logger.info(f"PDF Processed into {len(result)} chunks")
-        return result
\ No newline at end of file
+
+        path = await asyncio.to_thread(spool_pdf, file_content)
+        pending = []
+        try:
+            pages = await Executor.run("parse", count_pages, path)
+
+            if not pages:
+                logger.warning("No content")
+                return
+
+            windows = iter(range(0, pages, pageBatch))
+
+            def schedule():
+                start = next(windows, None)
+                if start is None:
+                    return
+                stop = min(start + pageBatch, pages)
+                task = asyncio.create_task(
+                    Executor.run("parse", split_pages, path, start, stop)
+                )
+                pending.append((stop, task))
+
+            # keep a few windows parsing ahead, but never more than the consumer can drain
+            for _ in range(parseWorkers):
+                schedule()
+
+            chunk_index = 0
+            tokens = 0
+            truncated = 0
+            legacy = 0
+            while pending:
+                stop, task = pending.pop(0)
+                chunks, window_tokens, window_truncated, window_legacy = await task
+                schedule()
+
+                tokens += window_tokens
+                truncated += window_truncated
+                legacy += window_legacy
+                Metrics.chunk_tokens.labels("embedded").inc(window_tokens)
+                Metrics.chunk_tokens.labels("truncated").inc(window_truncated)
+                Metrics.chunk_tokens.labels("legacy_truncated").inc(window_legacy)
+
+                if progress:
+                    await progress(pages_parsed=stop, tokens_truncated=truncated, legacy_tokens_truncated=legacy)
+
+                for chunk_text in chunks:
+                    yield chunk_index, chunk_text
+                    chunk_index += 1
+
+            logger.info(
+                f"PDF Processed {pages} pages into {chunk_index} chunks, "
+                f"{tokens} tokens embedded, {truncated} truncated ({legacy} with the character splitter)"
+            )
+        finally:
+            for _, task in pending:
+                task.cancel()
+            os.unlink(path)
+
+    @staticmethod
+    async def doc_process(file_content, file_type, progress=None):
+        return [
+            chunk async for chunk in Processor.stream_chunks(file_content, file_type, progress)
+        ]
@@ -1,36 +1,132 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import threading
+import unicodedata
 from loguru import logger
 import numpy as np
-from config import embeddingMod
+from config import embeddingModelId, queryCacheMB, queryCacheTTL, queryBatchSize, queryBatchWaitMs
+from .executor import Executor
+from .cache import LRUCache
+from .backends import load_backend
+
+class QueryBatcher:
+
+    def __init__(self, max_batch, max_wait_ms):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = {}
+        self.timer = None
+        self.tasks = set()
+
+    async def encode(self, text):
+        future = self.pending.get(text)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.pending[text] = future
+            
+            # an idle encoder takes the question at once; only a busy one is worth waiting on
+            if len(self.pending) >= self.max_batch or not self.tasks:
+                self._flush()
+            elif self.timer is None:
+                self.timer = loop.call_later(self.max_wait, self._flush)
+        
+        # the same text from another question resolves this future too; awaiting it bare would let one
+        # cancelled question cancel the future and fail the rest of the batch's callers for that text
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        
+        batch, self.pending = self.pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        texts = list(batch)
+        try:
+            model = await asyncio.to_thread(Embedding.get_model)
+            embeddings = await Executor.run("query", model.encode, texts)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # questions that queued behind this batch go next, without waiting out the window
+            if self.pending:
+                self._flush()
+        
+        for text, embedding in zip(texts, embeddings):
+            future = batch[text]
+            if not future.done():
+                future.set_result(embedding)
 
 class Embedding:
     
     model = None
+    model_lock = threading.Lock()
+    query_batcher = QueryBatcher(queryBatchSize, queryBatchWaitMs)
+    query_cache = LRUCache(
+        queryCacheMB * 1024 * 1024,
+        ttl=queryCacheTTL,
+        sizeof=lambda key, value: value.nbytes + len(key[1]) + 200
+    )
     
     @classmethod
     def get_model(cls):
         if cls.model is None:
-            logger.info(f"Loading model: {embeddingMod}")
-            cls.model = SentenceTransformer(embeddingMod)
-            logger.info("model loaded")
+            # startup loads the model in a thread while ingest workers may already ask for it
+            with cls.model_lock:
+                if cls.model is None:
+                    # backends import torch / onnxruntime themselves, which takes seconds
+                    cls.model = load_backend()
+                    logger.info("model loaded")
         return cls.model
     
+    @classmethod
+    async def warm_up(cls):
+        # the first encode pays for lazy initialisation inside torch; take that hit before traffic does
+        model = await asyncio.to_thread(cls.get_model)
+        await Executor.run("encode", model.encode, ["warm up"])
+    
+    @classmethod
+    def is_loaded(cls):
+        return cls.model is not None
+    
+    @staticmethod
+    def normalize_query(text):
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+    
     @classmethod
     async def generate_Embedding(cls, text):
        
         if not text or not text.strip():
             logger.warning("no text for embedding")
             return None
-        model = cls.get_model()
-        embedding = model.encode(text)
+        
+        text = cls.normalize_query(text)
+        key = (embeddingModelId, text)
+        embedding = cls.query_cache.get(key)
+        
+        if embedding is None:
+            embedding = await cls.query_batcher.encode(text)
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding.flags.writeable = False
+            cls.query_cache.put(key, embedding)
+        
         return list(embedding)  
     
     @classmethod
     async def batchEmbeddings(cls, texts):
         if not texts:
             return []
-        model = cls.get_model()
-        embeddings = model.encode(texts)
+        # off the loop: the first caller may wait on the startup load holding model_lock
+        model = await asyncio.to_thread(cls.get_model)
+        embeddings = await Executor.run("encode", model.encode, texts)
         return [list(i) for i in embeddings] 
     
     @staticmethod
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from loguru import logger
+from config import queryWorkers, encodeWorkers, parseWorkers, executorQueueDepth
+
+class Executor:
+
+    # query and ingest encodes get separate lanes so a large upload can't queue ahead of questions
+    LANES = {
+        "query": ("thread", queryWorkers),
+        "encode": ("thread", encodeWorkers),
+        "parse": ("process", parseWorkers),
+    }
+
+    pools = {}
+    limits = {}
+
+    @classmethod
+    def _lane(cls, name):
+        if name not in cls.pools:
+            kind, workers = cls.LANES[name]
+            if kind == "process":
+                # spawn, not fork: forking a process that already runs torch threads can deadlock
+                pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-worker")
+            cls.pools[name] = pool
+            cls.limits[name] = asyncio.Semaphore(workers + executorQueueDepth)
+            logger.info(f"Started {name} {kind} pool with {workers} workers")
+        return cls.pools[name], cls.limits[name]
+
+    @classmethod
+    async def run(cls, lane, fn, *args, **kwargs):
+        pool, limit = cls._lane(lane)
+        async with limit:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+    @classmethod
+    def shutdown(cls):
+        for name, pool in cls.pools.items():
+            pool.shutdown(wait=False, cancel_futures=True)
+            logger.info(f"Stopped {name} pool")
+        cls.pools = {}
+        cls.limits = {}
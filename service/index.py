@@ -0,0 +1,534 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from loguru import logger
+from config import (
+    topK, simi_threshold, indexQuantization, rescoreOversample, indexDir, indexMaxSegments, indexMaxTombstones,
+    indexCatchUpInterval, indexCatchUpLag
+)
+from .segments import Segment, SegmentStore
+
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+SCORE_BLOCK = 16384
+
+class ChunkIndex:
+
+    quantization = indexQuantization
+    ids = np.empty(0, dtype=np.int64)
+    doc_ids = np.empty(0, dtype=np.int32)
+    # float32 rows, or int8 / packed sign-bit codes when quantized
+    matrix = None
+    scales = None
+    dimension = None
+    size = 0
+    loaded = False
+    loading = False
+    pending = []
+    removed = []
+    lock = asyncio.Lock()
+
+    # with indexDir set, the loaded index lives in shared memory-mapped segments
+    store = SegmentStore(indexDir) if indexDir else None
+    segments = []
+    deleted = np.empty(0, dtype=np.int32)
+    generation = 0
+    manifest_stat = None
+    build_lock = None
+    compacting = False
+
+    # chunks written by other processes are found by id; ids can commit out of order, so the
+    # floor trails the newest id seen by indexCatchUpLag seconds and everything above it is
+    # compared with the index again on each poll
+    marks = []
+    checked = 0.0
+
+    @staticmethod
+    def normalize(embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def quantize(vectors, quantization):
+        if quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        if quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        return vectors, None
+
+    @staticmethod
+    def approximate(codes, scales, query, quantization):
+        if quantization == "none":
+            return codes @ query
+
+        # dequantize a block at a time so the float copy stays small
+        scores = np.empty(len(codes), dtype=np.float32)
+        bits = np.packbits(query > 0) if quantization == "binary" else None
+        for start in range(0, len(codes), SCORE_BLOCK):
+            block = slice(start, start + SCORE_BLOCK)
+            if quantization == "int8":
+                scores[block] = (codes[block].astype(np.float32) @ query) * scales[block]
+            else:
+                distance = POPCOUNT[np.bitwise_xor(codes[block], bits)].sum(axis=1, dtype=np.int32)
+                scores[block] = 1 - 2 * distance / len(query)
+        return scores
+
+    @classmethod
+    def shortlist(cls, limit):
+        if cls.quantization == "none":
+            return limit
+        return limit * rescoreOversample
+
+    @staticmethod
+    def rescore(query_embedding, chunk_ids, embeddings, limit=topK, threshold=simi_threshold):
+        if len(chunk_ids) == 0 or limit <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = ChunkIndex.normalize(query_embedding)[0]
+        scores = ChunkIndex.normalize(embeddings) @ query
+        top = np.argsort(-scores)[:limit]
+        top = top[scores[top] >= threshold]
+        return np.asarray(chunk_ids, dtype=np.int64)[top], scores[top]
+
+    @classmethod
+    def reset(cls):
+        cls._clear_arrays()
+        cls.dimension = None
+        cls.size = 0
+        cls.loaded = False
+        cls.segments = []
+        cls.deleted = np.empty(0, dtype=np.int32)
+        cls.generation = 0
+        cls.manifest_stat = None
+        cls.marks = []
+        cls.checked = 0.0
+
+    @classmethod
+    def _clear_arrays(cls):
+        cls.ids = np.empty(0, dtype=np.int64)
+        cls.doc_ids = np.empty(0, dtype=np.int32)
+        cls.matrix = None
+        cls.scales = None
+
+    @classmethod
+    def _shared(cls):
+        return cls.store is not None and cls.loaded
+
+    @classmethod
+    def parts(cls):
+        if cls._shared():
+            return cls.segments
+        if cls.size == 0:
+            return []
+        scales = cls.scales[:cls.size] if cls.scales is not None else None
+        return [Segment(None, cls.ids[:cls.size], cls.doc_ids[:cls.size], cls.matrix[:cls.size], scales)]
+
+    @classmethod
+    def _sync(cls, manifest):
+        if manifest.get("quantization", cls.quantization) != cls.quantization:
+            raise ValueError(
+                f"Index at {indexDir} uses {manifest['quantization']} quantization, "
+                f"not {cls.quantization}"
+            )
+
+        mapped = {segment.name: segment for segment in cls.segments}
+        cls.segments = [
+            mapped.get(name) or cls.store.open_segment(name) for name in manifest["segments"]
+        ]
+        cls.deleted = np.asarray(manifest["deleted"], dtype=np.int32)
+        cls.generation = manifest["generation"]
+        cls.dimension = manifest.get("dimension", cls.dimension)
+        cls.size = sum(segment.count for segment in cls.segments)
+
+    @classmethod
+    def refresh(cls):
+        if not cls._shared():
+            return
+
+        # a stat per search is all it costs when nothing changed
+        stat = cls.store.stat()
+        if stat is None or stat == cls.manifest_stat:
+            return
+
+        for _ in range(3):
+            try:
+                cls._sync(cls.store.read_manifest())
+                break
+            except FileNotFoundError:
+                # a compaction swapped the manifest between reading it and opening a segment
+                stat = cls.store.stat()
+        else:
+            logger.warning("Index segments kept changing during refresh, will retry")
+            return
+
+        cls.manifest_stat = stat
+        logger.debug(f"Chunk index at generation {cls.generation}, {len(cls.segments)} segments")
+
+    @classmethod
+    def _commit(cls, names=(), deleted=()):
+        def update(manifest):
+            if manifest.setdefault("quantization", cls.quantization) != cls.quantization:
+                raise ValueError(f"Index at {indexDir} uses {manifest['quantization']} quantization")
+            if cls.dimension is not None:
+                manifest.setdefault("dimension", cls.dimension)
+            manifest["segments"].extend(names)
+            manifest["deleted"].extend(int(document_id) for document_id in deleted)
+
+        manifest = cls.store.commit(update)
+        try:
+            # commits can run in several threads; an older one finishing last must not roll back
+            if manifest["generation"] > cls.generation:
+                cls._sync(manifest)
+        except FileNotFoundError:
+            # compacted away in the meantime; the next search maps the newer manifest
+            cls.manifest_stat = None
+
+        if not cls.compacting and (
+            len(manifest["segments"]) > indexMaxSegments or len(manifest["deleted"]) > indexMaxTombstones
+        ):
+            cls.compacting = True
+            threading.Thread(target=cls.compact, daemon=True).start()
+
+    @classmethod
+    def compact(cls):
+        try:
+            with cls.store.try_compaction_lock() as locked:
+                if not locked:
+                    return
+                manifest = cls.store.read_manifest()
+                deleted = manifest["deleted"]
+                segments = [cls.store.open_segment(name) for name in manifest["segments"]]
+
+                # tombstones can only be dropped once every segment that might hold them is rewritten
+                full = len(deleted) > indexMaxTombstones
+                if not full:
+                    segments.sort(key=lambda segment: segment.count)
+                    segments = segments[:max(2, len(segments) // 2)]
+                merged = {segment.name for segment in segments}
+
+                dead = np.asarray(deleted, dtype=np.int32)
+                keep = [~np.isin(segment.doc_ids, dead) for segment in segments]
+                name = None
+                if sum(int(mask.sum()) for mask in keep):
+                    scales = None
+                    if segments[0].scales is not None:
+                        scales = np.concatenate([segment.scales[mask] for segment, mask in zip(segments, keep)])
+                    name = cls.store.write_segment(
+                        np.concatenate([segment.ids[mask] for segment, mask in zip(segments, keep)]),
+                        np.concatenate([segment.doc_ids[mask] for segment, mask in zip(segments, keep)]),
+                        np.concatenate([segment.matrix[mask] for segment, mask in zip(segments, keep)]),
+                        scales
+                    )
+
+                def update(current):
+                    current["segments"] = [n for n in current["segments"] if n not in merged]
+                    if name:
+                        current["segments"].insert(0, name)
+                    if full:
+                        applied = set(deleted)
+                        current["deleted"] = [d for d in current["deleted"] if d not in applied]
+
+                cls.store.commit(update)
+                cls.store.remove_segments(merged)
+                logger.info(f"Compacted {len(merged)} index segments")
+        except Exception as e:
+            logger.error(f"Index compaction failed: {e}")
+        finally:
+            cls.compacting = False
+
+    @classmethod
+    def catch_up_due(cls):
+        if not cls.loaded or cls.loading:
+            return False
+        now = time.monotonic()
+        if now - cls.checked < indexCatchUpInterval:
+            return False
+        cls.checked = now
+        return True
+
+    @classmethod
+    def catch_up_floor(cls):
+        cutoff = time.monotonic() - indexCatchUpLag
+        while len(cls.marks) > 1 and cls.marks[1][0] <= cutoff:
+            cls.marks.pop(0)
+        return cls.marks[0][1] if cls.marks else 0
+
+    @classmethod
+    def mark(cls, newest):
+        if cls.marks:
+            newest = max(newest, cls.marks[-1][1])
+        cls.marks.append((time.monotonic(), newest))
+
+    @classmethod
+    @contextmanager
+    def catching_up(cls):
+        # one process per indexDir catches up at a time, after mapping what the others already added
+        if not cls._shared():
+            yield True
+            return
+        with cls.store.try_catch_up_lock() as locked:
+            if locked:
+                cls.refresh()
+            yield locked
+
+    @classmethod
+    def unknown(cls, chunk_ids, floor=0):
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        known = [np.asarray(part.ids[part.ids > floor]) for part in cls.parts()]
+        if not known:
+            return chunk_ids
+        return chunk_ids[~np.isin(chunk_ids, np.concatenate(known))]
+
+    @classmethod
+    def documents(cls, chunk_ids):
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if len(chunk_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        found = [np.asarray(part.doc_ids[np.isin(part.ids, chunk_ids)]) for part in cls.parts()]
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def _reserve(cls, count, codes, scales):
+        if cls.matrix is None:
+            capacity = max(count, 1024)
+            cls.matrix = np.empty((capacity, codes.shape[1]), dtype=codes.dtype)
+            cls.scales = np.empty(capacity, dtype=np.float32) if scales is not None else None
+            cls.ids = np.empty(capacity, dtype=np.int64)
+            cls.doc_ids = np.empty(capacity, dtype=np.int32)
+            return
+
+        needed = cls.size + count
+        capacity = len(cls.ids)
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity *= 2
+
+        matrix = np.empty((capacity, cls.matrix.shape[1]), dtype=cls.matrix.dtype)
+        matrix[:cls.size] = cls.matrix[:cls.size]
+        if cls.scales is not None:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:cls.size] = cls.scales[:cls.size]
+            cls.scales = scales
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:cls.size] = cls.ids[:cls.size]
+        doc_ids = np.empty(capacity, dtype=np.int32)
+        doc_ids[:cls.size] = cls.doc_ids[:cls.size]
+        cls.matrix, cls.ids, cls.doc_ids = matrix, ids, doc_ids
+
+    @classmethod
+    def _append(cls, chunk_ids, document_ids, vectors):
+        count = len(vectors)
+        if count == 0:
+            return
+        if cls.dimension is None:
+            cls.dimension = vectors.shape[1]
+        elif vectors.shape[1] != cls.dimension:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match index dimension {cls.dimension}"
+            )
+
+        codes, scales = cls.quantize(vectors, cls.quantization)
+        if cls._shared():
+            cls._commit([cls.store.write_segment(chunk_ids, document_ids, codes, scales)])
+            return
+
+        cls._reserve(count, codes, scales)
+        cls.matrix[cls.size:cls.size + count] = codes
+        if scales is not None:
+            cls.scales[cls.size:cls.size + count] = scales
+        cls.ids[cls.size:cls.size + count] = chunk_ids
+        cls.doc_ids[cls.size:cls.size + count] = document_ids
+        cls.size += count
+
+    @classmethod
+    async def offload(cls, method, *args):
+        # a shared change writes a segment and commits the manifest, both fsynced, so it runs
+        # in a thread; the local arrays are also read by searches and stay on the event loop
+        if cls._shared():
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    @classmethod
+    def add(cls, chunk_ids, document_ids, embeddings):
+        if len(chunk_ids) == 0:
+            return
+        vectors = cls.normalize(embeddings)
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        document_ids = np.broadcast_to(np.asarray(document_ids, dtype=np.int32), chunk_ids.shape)
+
+        if cls.loading:
+            cls.pending.append((chunk_ids, document_ids, vectors))
+        elif cls.loaded:
+            cls._append(chunk_ids, document_ids, vectors)
+
+    @classmethod
+    def remove_document(cls, document_id):
+        if cls._shared():
+            cls._commit(deleted=[document_id])
+            return
+
+        pending = []
+        for chunk_ids, document_ids, vectors in cls.pending:
+            keep = document_ids != document_id
+            pending.append((chunk_ids[keep], document_ids[keep], vectors[keep]))
+        cls.pending = pending
+        if cls.loading:
+            cls.removed.append(document_id)
+        cls._drop([document_id])
+
+    @classmethod
+    def _drop(cls, document_ids):
+        keep = ~np.isin(cls.doc_ids[:cls.size], np.asarray(document_ids, dtype=np.int32))
+        count = int(keep.sum())
+        if count == cls.size:
+            return
+
+        cls.matrix[:count] = cls.matrix[:cls.size][keep]
+        if cls.scales is not None:
+            cls.scales[:count] = cls.scales[:cls.size][keep]
+        cls.ids[:count] = cls.ids[:cls.size][keep]
+        cls.doc_ids[:count] = cls.doc_ids[:cls.size][keep]
+        cls.size = count
+
+    @classmethod
+    def begin_load(cls):
+        cls.reset()
+        cls.loading = True
+        cls.pending = []
+        cls.removed = []
+
+    @classmethod
+    def claim(cls):
+        # blocks until no other process is building; True means the caller must read the chunks itself
+        if cls.store is None:
+            return True
+        cls.build_lock = cls.store.acquire_build_lock()
+        manifest = cls.store.read_manifest()
+        if manifest is None:
+            return True
+        cls._sync(manifest)
+        # size counts the local arrays until the load finishes
+        cls.size = 0
+        return False
+
+    @classmethod
+    def stored(cls):
+        # the chunk ids and live document ids in the claimed manifest, to check against the database
+        ids = [segment.ids for segment in cls.segments]
+        doc_ids = [segment.doc_ids for segment in cls.segments]
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(ids), np.setdiff1d(np.concatenate(doc_ids), cls.deleted)
+
+    @classmethod
+    def _release_build(cls):
+        if cls.build_lock is not None:
+            SegmentStore.release_build_lock(cls.build_lock)
+            cls.build_lock = None
+
+    @classmethod
+    def load_batch(cls, chunk_ids, document_ids, embeddings):
+        if len(chunk_ids) == 0:
+            return
+        cls._append(
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(document_ids, dtype=np.int32),
+            cls.normalize(embeddings)
+        )
+
+    @classmethod
+    def finish_load(cls):
+        # chunks inserted while the snapshot was being read may or may not be in it
+        known = np.concatenate([cls.ids[:cls.size]] + [segment.ids for segment in cls.segments])
+        for chunk_ids, document_ids, vectors in cls.pending:
+            fresh = ~np.isin(chunk_ids, known)
+            cls._append(chunk_ids[fresh], document_ids[fresh], vectors[fresh])
+        if cls.removed:
+            cls._drop(cls.removed)
+        cls.pending = []
+        cls.loading = False
+
+        if cls.store is not None:
+            try:
+                names = []
+                if cls.size:
+                    names.append(cls.store.write_segment(
+                        cls.ids[:cls.size], cls.doc_ids[:cls.size], cls.matrix[:cls.size],
+                        cls.scales[:cls.size] if cls.scales is not None else None
+                    ))
+                cls._clear_arrays()
+                cls.loaded = True
+                cls._commit(names, cls.removed)
+                cls.manifest_stat = None
+            finally:
+                cls._release_build()
+
+        cls.removed = []
+        cls.loaded = True
+        newest = [int(part.ids.max()) for part in cls.parts() if part.count]
+        cls.marks = [(time.monotonic(), max(newest, default=0))]
+        logger.info(f"Chunk index loaded with {cls.size} embeddings ({cls.quantization} quantization)")
+
+    @classmethod
+    def abort_load(cls):
+        cls._release_build()
+        cls.pending = []
+        cls.removed = []
+        cls.loading = False
+        cls.reset()
+
+    @classmethod
+    def search(cls, query_embedding, document_ids=None, limit=topK, threshold=simi_threshold, excluded=()):
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        cls.refresh()
+        if cls.size == 0 or limit <= 0:
+            return empty
+
+        query = cls.normalize(query_embedding)[0]
+        shortlist = cls.shortlist(limit)
+        selected = np.asarray(document_ids, dtype=np.int32) if document_ids is not None else None
+        dead = np.union1d(cls.deleted, np.asarray(list(excluded), dtype=np.int32))
+
+        # each segment contributes its own best rows, then the candidates are ranked together
+        candidate_ids, candidate_scores = [], []
+        for part in cls.parts():
+            scores = np.asarray(cls.approximate(part.matrix, part.scales, query, cls.quantization))
+
+            if selected is not None:
+                scores[~np.isin(part.doc_ids, selected)] = -np.inf
+            if len(dead):
+                scores[np.isin(part.doc_ids, dead)] = -np.inf
+
+            k = min(shortlist, part.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidate_ids.append(np.asarray(part.ids[top]))
+            candidate_scores.append(scores[top])
+
+        if not candidate_ids:
+            return empty
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if cls._shared():
+            # another worker can catch up on rows before the worker that stored them writes its segment
+            ids, first = np.unique(ids, return_index=True)
+            scores = scores[first]
+
+        # quantized scores only pick an oversampled shortlist; rescore() applies the exact cut
+        top = np.argsort(-scores)[:shortlist]
+        if cls.quantization == "none":
+            top = top[scores[top] >= threshold]
+        else:
+            top = top[scores[top] > -np.inf]
+
+        if len(top) == 0:
+            return empty
+        return ids[top], scores[top]
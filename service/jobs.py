@@ -0,0 +1,162 @@
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from loguru import logger
+from .rag import RAG
+from database.operations import DatabaseOperation
+from config import ingestWorkers, jobPollInterval, jobStaleAfter, jobMaxAttempts, jobClaimBatch, jobHeartbeat
+
+class IngestWorkers:
+
+    tasks = []
+    wakeup = None
+
+    @classmethod
+    def start(cls, concurrency=ingestWorkers):
+        cls.wakeup = asyncio.Event()
+        cls.tasks = [
+            asyncio.create_task(cls._worker(number), name=f"ingest-worker-{number}")
+            for number in range(concurrency)
+        ]
+        logger.info(f"Started {concurrency} ingestion workers")
+
+    @classmethod
+    async def stop(cls):
+        for task in cls.tasks:
+            task.cancel()
+        await asyncio.gather(*cls.tasks, return_exceptions=True)
+        cls.tasks = []
+        logger.info("Ingestion workers stopped")
+
+    @classmethod
+    def notify(cls):
+        if cls.wakeup is not None:
+            cls.wakeup.set()
+
+    @classmethod
+    async def _idle(cls):
+        try:
+            await asyncio.wait_for(cls.wakeup.wait(), timeout=jobPollInterval)
+        except asyncio.TimeoutError:
+            pass
+        cls.wakeup.clear()
+
+    @classmethod
+    async def _worker(cls, number):
+        while True:
+            try:
+                jobs = await DatabaseOperation.claim_jobs(jobStaleAfter, jobMaxAttempts, jobClaimBatch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion worker {number} could not claim a job: {e}")
+                jobs = []
+
+            if not jobs:
+                await cls._idle()
+                continue
+
+            if len(jobs) == 1:
+                await cls._run(jobs[0])
+            else:
+                await cls._run_batch(jobs)
+
+    @staticmethod
+    @asynccontextmanager
+    async def _heartbeat(jobs):
+        # progress updates are irregular (a batch's encode loop sends none), so a timer keeps
+        # the claim fresh until the work is done
+        owned = [(job['id'], job['attempts']) for job in jobs]
+
+        async def beat():
+            while True:
+                await asyncio.sleep(jobHeartbeat)
+                try:
+                    alive = await DatabaseOperation.heartbeat_jobs(owned)
+                except Exception as e:
+                    logger.error(f"Could not refresh ingestion jobs {[job_id for job_id, _ in owned]}: {e}")
+                    continue
+                lost = [job_id for job_id, _ in owned if job_id not in alive]
+                if lost:
+                    logger.warning(f"Ingestion jobs {lost} were taken over by another worker")
+
+        task = asyncio.create_task(beat())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @staticmethod
+    async def _release(jobs):
+        # hand jobs back on shutdown; if even that fails the stale heartbeat frees them
+        for job in jobs:
+            try:
+                await DatabaseOperation.release_job(job['id'], job['attempts'])
+            except Exception as e:
+                logger.error(f"Could not release ingestion job {job['id']}: {e}")
+
+    @staticmethod
+    async def _finish(job, result):
+        job_id = job['id']
+        if isinstance(result, Exception):
+            logger.error(f"Ingestion job {job_id} failed: {result}")
+            owned = await DatabaseOperation.finish_job(job_id, job['attempts'], "failed", error=str(result))
+        elif not result:
+            owned = await DatabaseOperation.finish_job(
+                job_id, job['attempts'], "failed", error="No text could be extracted"
+            )
+        else:
+            owned = await DatabaseOperation.finish_job(job_id, job['attempts'], "completed", document_id=result)
+            logger.info(f"Ingestion job {job_id} completed with document ID: {result}")
+        if not owned:
+            logger.warning(f"Ingestion job {job_id} was taken over by another worker; its result was not recorded")
+
+    @classmethod
+    async def _run_batch(cls, jobs):
+        logger.info(f"Processing {len(jobs)} ingestion jobs from batch {jobs[0]['batch_id']}")
+
+        files = [
+            {
+                'file_content': job['file_content'],
+                'filename': job['filename'],
+                'file_type': job['file_type'],
+                'content_type': job['content_type'],
+                'progress': functools.partial(DatabaseOperation.update_job, job['id'], job['attempts'])
+            }
+            for job in jobs
+        ]
+
+        try:
+            async with cls._heartbeat(jobs):
+                results = await RAG.processStore_batch(files)
+        except asyncio.CancelledError:
+            await cls._release(jobs)
+            raise
+        except Exception as e:
+            results = [e] * len(jobs)
+
+        for job, result in zip(jobs, results):
+            await cls._finish(job, result)
+
+    @classmethod
+    async def _run(cls, job):
+        job_id = job['id']
+        logger.info(f"Processing ingestion job {job_id} ({job['filename']})")
+
+        try:
+            async with cls._heartbeat([job]):
+                document_id = await RAG.processStore_document(
+                    job['file_content'],
+                    job['filename'],
+                    job['file_type'],
+                    job['content_type'],
+                    progress=functools.partial(DatabaseOperation.update_job, job_id, job['attempts'])
+                )
+        except asyncio.CancelledError:
+            await cls._release([job])
+            raise
+        except Exception as e:
+            document_id = e
+
+        await cls._finish(job, document_id)
@@ -1,52 +1,112 @@
+import json
 import aiohttp
 from loguru import logger
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import ollamaUrl, ollamaModel
+from config import ollamaUrl, ollamaModel, ollamaConnections, ollamaKeepalive, ollamaTimeout
 
 class LLM:
-    
+
+    session = None
+    # returned in place of an answer; never worth caching
+    error_answer = "Error ollama"
+    failed_answer = "couldn't generate an answer."
+
+    @classmethod
+    async def open_session(cls):
+        if cls.session is None or cls.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=ollamaConnections,
+                keepalive_timeout=ollamaKeepalive
+            )
+            cls.session = aiohttp.ClientSession(connector=connector)
+            logger.info(f"Ollama client session opened ({ollamaConnections} connections)")
+        return cls.session
+
+    @classmethod
+    async def close_session(cls):
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+            logger.info("Ollama client session closed")
+
     @staticmethod
-    async def answerGenerator(question, context):
-       
-        try:
-            prompt = f"""
+    def build_request(question, context, stream):
+        prompt = f"""
             You are a helpful assistant that answers questions based on the provided context.
-            
+
             Context:
             {context}
-            
+
             Question: {question}
-            
+
             Answer the question based ONLY on the given context.
             If you don't have enough information, say "I don't have enough information to answer this question."
-            
+
             Answer:
             """
-            
-            data = {
-                "model": ollamaModel,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": 0.3,
-                "max_tokens": 512
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    ollamaUrl, 
-                    json=data,
-                    timeout=60
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get("response", "").strip()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ollama Error: {response.status} - {error_text}")
-                        return "Error ollama"
-                
+
+        return {
+            "model": ollamaModel,
+            "prompt": prompt,
+            "stream": stream,
+            "temperature": 0.3,
+            "max_tokens": 512
+        }
+
+    @classmethod
+    async def answerGenerator(cls, question, context):
+
+        try:
+            data = cls.build_request(question, context, stream=False)
+            session = await cls.open_session()
+
+            async with session.post(
+                ollamaUrl,
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=ollamaTimeout)
+            ) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result.get("response", "").strip()
+                else:
+                    error_text = await response.text()
+                    logger.error(f"Ollama Error: {response.status} - {error_text}")
+                    return cls.error_answer
+
+        except Exception as e:
+            logger.error(f"Ollama error: {e}")
+            return cls.failed_answer
+
+    @classmethod
+    async def answerStream(cls, question, context):
+
+        try:
+            data = cls.build_request(question, context, stream=True)
+            session = await cls.open_session()
+
+            # no total limit while tokens keep arriving; only a stalled stream times out
+            async with session.post(
+                ollamaUrl,
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=ollamaTimeout)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Ollama Error: {response.status} - {error_text}")
+                    yield cls.error_answer
+                    return
+
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    part = json.loads(line)
+                    if part.get("response"):
+                        yield part["response"]
+                    if part.get("done"):
+                        break
+
         except Exception as e:
             logger.error(f"Ollama error: {e}")
-            return "couldn't generate an answer."
\ No newline at end of file
+            yield cls.failed_answer
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metrics:
+
+    content_type = CONTENT_TYPE_LATEST
+
+    stage_seconds = Histogram(
+        "rag_stage_seconds",
+        "Time spent in each stage of question answering and ingest",
+        ["pipeline", "stage"],
+        buckets=STAGE_BUCKETS
+    )
+    pool_wait_seconds = Histogram(
+        "db_pool_wait_seconds",
+        "Time spent waiting for a database connection from the pool",
+        buckets=STAGE_BUCKETS
+    )
+    questions = Counter("rag_questions_total", "Questions answered", ["outcome"])
+    documents = Counter("rag_documents_ingested_total", "Documents ingested", ["outcome"])
+    chunks = Counter("rag_chunks_ingested_total", "Chunks stored during ingest")
+    chunk_tokens = Counter("rag_chunk_tokens_total", "Model tokens in ingested chunks, tokens past the model limit, and tokens the character splitter would have put past it", ["kind"])
+    coalesced = Counter("rag_questions_coalesced_total", "Questions that waited for an identical question already in progress")
+    admission = Counter("rag_llm_admission_total", "LLM slot requests", ["outcome"])
+    llm_waiting = Gauge("rag_llm_waiting", "Questions waiting for an LLM slot")
+    context_tokens = Counter("rag_context_tokens_total", "Estimated context tokens before and after packing", ["kind"])
+
+    # per-request stage totals, only collected while a request has opted in
+    timings = ContextVar("timings", default=None)
+
+    @classmethod
+    @contextmanager
+    def stage(cls, pipeline, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(pipeline, stage, time.perf_counter() - started)
+
+    @classmethod
+    async def timed(cls, pipeline, stage, awaitable):
+        with cls.stage(pipeline, stage):
+            return await awaitable
+
+    @classmethod
+    def observe(cls, pipeline, stage, seconds):
+        cls.stage_seconds.labels(pipeline, stage).observe(seconds)
+        timings = cls.timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @classmethod
+    def observe_pool_wait(cls, seconds):
+        cls.pool_wait_seconds.observe(seconds)
+        timings = cls.timings.get()
+        if timings is not None:
+            timings["db_wait"] = timings.get("db_wait", 0.0) + seconds
+
+    @classmethod
+    def collect(cls):
+        cls.timings.set({})
+
+    @classmethod
+    def server_timing(cls):
+        timings = cls.timings.get() or {}
+        return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+    @staticmethod
+    def export():
+        return generate_latest()
@@ -1,68 +1,411 @@
+import asyncio
+import time
 from loguru import logger
 from .document import Processor
 from .embedding import Embedding
 from .llm import LLM
+from .index import ChunkIndex
+from .selection import SelectionCache
+from .metrics import Metrics
+from .context import ContextBuilder
+from .answers import AnswerCache
+from .admission import SingleFlight, Admission
 from database.operations import DatabaseOperation
-from config import topK
+from config import (
+    topK, ingestBatchSize, ingestQueueDepth, batchEmbedSize,
+    retrievalMode, hybridCandidates, rrfK
+)
+
+# per-ranker score fields; RRF keeps them while replacing 'rank' with the fused score
+RANKERS = ("similarity", "text_rank")
 
 class RAG:
     
+    flights = SingleFlight()
+    admission = Admission()
+    
     @staticmethod
-    async def processStore_document(file_content, filename, file_type, content_type):
-      
-        chunks = await Processor.doc_process(file_content, file_type)
+    async def embed_chunks(texts):
+        
+        chunk_hashes = [DatabaseOperation.content_hash(text) for text in texts]
+        embeddings = await DatabaseOperation.get_embeddings_by_hash(chunk_hashes)
+        
+        missing = {}
+        for text, chunk_hash in zip(texts, chunk_hashes):
+            if chunk_hash not in embeddings:
+                missing.setdefault(chunk_hash, text)
+        
+        if missing:
+            fresh = await Embedding.batchEmbeddings(list(missing.values()))
+            embeddings.update(zip(missing, fresh))
+        
+        return [embeddings[chunk_hash] for chunk_hash in chunk_hashes], len(texts) - len(missing)
+    
+    @staticmethod
+    async def processStore_document(file_content, filename, file_type, content_type, progress=None):
+        
+        started = time.perf_counter()
+        content_hash = DatabaseOperation.content_hash(file_content)
         
-        if not chunks:
+        duplicate = await DatabaseOperation.get_doc_by_hash(content_hash)
+        if duplicate:
+            logger.info(f"{filename} is identical to document {duplicate['id']}, skipping ingest")
+            return duplicate['id']
+        
+        batches = asyncio.Queue(maxsize=ingestQueueDepth)
+        
+        async def produce():
+            try:
+                batch = []
+                async for chunk in Processor.stream_chunks(file_content, file_type, progress):
+                    batch.append(chunk)
+                    if len(batch) >= ingestBatchSize:
+                        await batches.put(batch)
+                        batch = []
+                if batch:
+                    await batches.put(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await batches.put(e)
+                return
+            await batches.put(None)
+        
+        producer = asyncio.create_task(produce())
+        document_id = None
+        embedded = 0
+        reused = 0
+        stored = 0
+        
+        try:
+            while True:
+                # time spent waiting here is time the parser is behind the consumer
+                batch = await Metrics.timed("ingest", "parse", batches.get())
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                
+                embeddings, batch_reused = await Metrics.timed(
+                    "ingest", "embed", RAG.embed_chunks([chunk[1] for chunk in batch])
+                )
+                embedded += len(embeddings)
+                reused += batch_reused
+                if progress:
+                    await progress(chunks_embedded=embedded, chunks_reused=reused)
+                
+                # the document row appears with the first batch, so empty PDFs leave nothing behind
+                if document_id is None:
+                    document_id = await DatabaseOperation.insert_doc(
+                        filename, file_type, content_type, status="processing",
+                        content_hash=content_hash
+                    )
+                    # recorded on the job so a retry after a crash can remove the partial document
+                    if progress:
+                        await progress(document_id=document_id)
+                
+                with Metrics.stage("ingest", "store"):
+                    chunk_ids = await DatabaseOperation.insert_chunks(document_id, batch, embeddings)
+                    await ChunkIndex.offload(ChunkIndex.add, chunk_ids, document_id, embeddings)
+                stored += len(chunk_ids)
+                if progress:
+                    await progress(chunks_stored=stored)
+            
+            await producer
+        except BaseException:
+            producer.cancel()
+            Metrics.documents.labels("failed").inc()
+            if document_id is not None:
+                await ChunkIndex.offload(ChunkIndex.remove_document, document_id)
+                await DatabaseOperation.delete_doc(document_id)
+            raise
+        
+        if document_id is None:
             logger.warning(f"No text chunks extracted from {filename}")
             return None
         
-        logger.info(f"Extracted {len(chunks)} chunks from {filename}")
+        await DatabaseOperation.set_doc_status(document_id, "ready")
         
-        document_id = await DatabaseOperation.insert_doc(
-            filename, file_type, content_type
+        elapsed = time.perf_counter() - started
+        Metrics.observe("ingest", "total", elapsed)
+        Metrics.documents.labels("stored").inc()
+        Metrics.chunks.inc(stored)
+        rate = stored / elapsed if elapsed > 0 else float("inf")
+        logger.info(
+            f"Document {filename} processed and stored with ID: {document_id} "
+            f"({stored} chunks in {elapsed:.2f}s, {rate:.0f} chunks/sec, {reused} embeddings reused)"
         )
-      
-        chunk_text = [chunk[1] for chunk in chunks]
-        embeddings = await Embedding.batchEmbeddings(chunk_text)
-       
-        for (chunk_index, chunk_text), embedding in zip(chunks, embeddings):
-            await DatabaseOperation.insert_chunk(
-                document_id, chunk_text, chunk_index, embedding
+        return document_id
+    
+    @staticmethod
+    async def processStore_batch(files):
+        
+        started = time.perf_counter()
+        results = [None] * len(files)
+        parsed = []
+        
+        async def parse(position, file):
+            content_hash = DatabaseOperation.content_hash(file['file_content'])
+            duplicate = await DatabaseOperation.get_doc_by_hash(content_hash)
+            if duplicate:
+                logger.info(f"{file['filename']} is identical to document {duplicate['id']}, skipping ingest")
+                results[position] = duplicate['id']
+                return
+            
+            chunks = await Processor.doc_process(file['file_content'], file['file_type'], file.get('progress'))
+            if not chunks:
+                logger.warning(f"No text chunks extracted from {file['filename']}")
+                return
+            parsed.append((position, file, content_hash, chunks))
+        
+        # every file parses concurrently on the process pool; one bad file doesn't sink the batch
+        outcomes = await Metrics.timed("ingest", "parse", asyncio.gather(
+            *(parse(position, file) for position, file in enumerate(files)),
+            return_exceptions=True
+        ))
+        for position, outcome in enumerate(outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to parse {files[position]['filename']}: {outcome}")
+                results[position] = outcome
+        
+        parsed.sort(key=lambda item: item[0])
+        texts = [chunk_text for _, _, _, chunks in parsed for _, chunk_text in chunks]
+        
+        # chunks from all files are encoded together so the model sees full batches
+        embeddings = []
+        reused = 0
+        for start in range(0, len(texts), batchEmbedSize):
+            batch_embeddings, batch_reused = await Metrics.timed(
+                "ingest", "embed", RAG.embed_chunks(texts[start:start + batchEmbedSize])
             )
+            embeddings.extend(batch_embeddings)
+            reused += batch_reused
         
-        logger.info(f"Document {filename} processed and stored with ID: {document_id}")
-        return document_id
+        offset = 0
+        stored = 0
+        for position, file, content_hash, chunks in parsed:
+            document_embeddings = embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            progress = file.get('progress')
+            
+            try:
+                if progress:
+                    await progress(chunks_embedded=len(document_embeddings))
+                
+                with Metrics.stage("ingest", "store"):
+                    document_id, chunk_ids = await DatabaseOperation.store_document(
+                        file['filename'], file['file_type'], file['content_type'],
+                        chunks, document_embeddings, content_hash=content_hash
+                    )
+                    await ChunkIndex.offload(ChunkIndex.add, chunk_ids, document_id, document_embeddings)
+                
+                if progress:
+                    await progress(chunks_stored=len(chunk_ids))
+            except Exception as e:
+                logger.error(f"Failed to store {file['filename']}: {e}")
+                Metrics.documents.labels("failed").inc()
+                results[position] = e
+                continue
+            
+            results[position] = document_id
+            stored += len(chunk_ids)
+            Metrics.documents.labels("stored").inc()
+        
+        Metrics.chunks.inc(stored)
+        elapsed = time.perf_counter() - started
+        rate = stored / elapsed if elapsed > 0 else float("inf")
+        logger.info(
+            f"Batch of {len(files)} files stored {stored} chunks in {elapsed:.2f}s "
+            f"({rate:.0f} chunks/sec, {reused} embeddings reused)"
+        )
+        return results
     
     @staticmethod
-    async def doc_selection(document_ids):
+    async def doc_selection(document_ids, selection_id="default"):
        
-        await DatabaseOperation.doc_selection(document_ids)
+        await SelectionCache.set(selection_id, document_ids)
         logger.info(f"Selected {len(document_ids)} documents for Q&A")
     
     @staticmethod
-    async def answer_question(question):
+    def scored(chunks, ranker):
+        # keeps each ranker's own score next to 'rank', which fusion replaces
+        for chunk in chunks:
+            chunk[ranker] = chunk['rank']
+        return chunks
+    
+    @staticmethod
+    def fuse(*rankings):
+        
+        # reciprocal-rank fusion: only positions matter, so cosine and ts_rank scores need no calibration
+        fused = {}
+        for ranking in rankings:
+            for position, chunk in enumerate(ranking):
+                entry = fused.setdefault(chunk['id'], dict(chunk, rank=0.0))
+                entry.update((ranker, chunk[ranker]) for ranker in RANKERS if ranker in chunk)
+                entry['rank'] += 1.0 / (rrfK + position + 1)
+        
+        return sorted(fused.values(), key=lambda chunk: chunk['rank'], reverse=True)
+    
+    @staticmethod
+    async def retrieve(question, selection_id="default"):
+        
+        document_ids = await SelectionCache.get(selection_id)
         
-        question_embedding = await Embedding.generate_Embedding(question)
+        if retrievalMode == "lexical" or not Embedding.is_loaded():
+            similar_chunks = RAG.scored(
+                await DatabaseOperation.lexical_chunks_search(question, topK, document_ids), "text_rank"
+            )
+            if not similar_chunks:
+                logger.warning("No relevant chunks found")
+            return similar_chunks
+        
+        question_embedding = await Metrics.timed("query", "embed", Embedding.generate_Embedding(question))
         
         if not question_embedding:
             logger.warning("Could not generate embedding")
-            return "I couldn't process your question."
+            return None
        
-        similar_chunks = await DatabaseOperation.similar_chunks_search(
-            question_embedding, topK
-        )
+        if retrievalMode == "hybrid":
+            vector_chunks, lexical_chunks = await asyncio.gather(
+                DatabaseOperation.similar_chunks_search(question_embedding, hybridCandidates, document_ids),
+                DatabaseOperation.lexical_chunks_search(question, hybridCandidates, document_ids)
+            )
+            with Metrics.stage("query", "fuse"):
+                similar_chunks = RAG.fuse(
+                    RAG.scored(vector_chunks, "similarity"), RAG.scored(lexical_chunks, "text_rank")
+                )[:topK]
+        else:
+            similar_chunks = RAG.scored(
+                await DatabaseOperation.similar_chunks_search(question_embedding, topK, document_ids),
+                "similarity"
+            )
         
         if not similar_chunks:
             logger.warning("No relevant chunks found")
-            return "No relevant information in the documents."
-       
-        context = "\n\n".join([chunk['chunk_text'] for chunk in similar_chunks])
+        return similar_chunks
+    
+    @staticmethod
+    def sources(chunks):
+        # similarity is the cosine score and text_rank the full-text score, each None when that search
+        # did not find the chunk; score is what the chunks were ordered by (the fused score in hybrid mode)
+        return [
+            {
+                "document_id": chunk['document_id'],
+                "filename": chunk['filename'],
+                "similarity": chunk.get('similarity'),
+                "text_rank": chunk.get('text_rank'),
+                "score": chunk['rank']
+            }
+            for chunk in chunks
+        ]
+    
+    @staticmethod
+    def failed(answer):
+        return answer in (LLM.error_answer, LLM.failed_answer)
+    
+    @staticmethod
+    def describe(source):
+        scores = []
+        if source.get('similarity') is not None:
+            scores.append(f"Similarity: {source['similarity']:.4f}")
+        if source.get('text_rank') is not None:
+            scores.append(f"Text match: {source['text_rank']:.4f}")
+        return f"- {source['filename']} ({', '.join(scores)})"
+    
+    @staticmethod
+    def format_answer(answer, sources):
+        sources_text = "\n".join(RAG.describe(source) for source in sources)
+        return f"{answer}\n\nSources:\n{sources_text}"
+    
+    @staticmethod
+    async def answer_question(question, selection_id="default", use_cache=True):
         
-        answer = await LLM.answerGenerator(question, context)
+        key = (Embedding.normalize_query(question), selection_id, use_cache)
+        return await RAG.flights.run(key, lambda: RAG.compute_answer(question, selection_id, use_cache))
+    
+    @staticmethod
+    async def compute_answer(question, selection_id="default", use_cache=True):
+        
+        with Metrics.stage("query", "total"):
+            with Metrics.stage("query", "answer_cache"):
+                document_ids = await SelectionCache.get(selection_id)
+                cached, ticket = await AnswerCache.lookup(question, document_ids, use_cache)
+            
+            if cached is not None:
+                Metrics.questions.labels("cached").inc()
+                return RAG.format_answer(*cached)
+            
+            # no point retrieving context for a question that cannot get an LLM slot
+            if RAG.admission.full():
+                raise RAG.admission.reject()
+            
+            similar_chunks = await RAG.retrieve(question, selection_id)
+            
+            if similar_chunks is None:
+                Metrics.questions.labels("failed").inc()
+                return "I couldn't process your question."
+            
+            if not similar_chunks:
+                Metrics.questions.labels("no_context").inc()
+                return "No relevant information in the documents."
+           
+            with Metrics.stage("query", "context"):
+                context, similar_chunks = ContextBuilder.build(similar_chunks)
+            
+            async with RAG.admission.slot():
+                answer = await Metrics.timed("query", "llm", LLM.answerGenerator(question, context))
+        
+        Metrics.questions.labels("answered").inc()
      
-        sources = [f"- {chunk['filename']} (Similarity: {chunk['rank']:.4f})" for chunk in similar_chunks]
-        sources_text = "\n".join(sources)
+        sources = RAG.sources(similar_chunks)
+        if not RAG.failed(answer):
+            AnswerCache.store(ticket, question, answer, sources)
+        
+        return RAG.format_answer(answer, sources)
+    
+    @staticmethod
+    async def answer_stream(question, selection_id="default", use_cache=True):
+        
+        document_ids = await SelectionCache.get(selection_id)
+        cached, ticket = await AnswerCache.lookup(question, document_ids, use_cache)
+        
+        if cached is not None:
+            Metrics.questions.labels("cached").inc()
+            answer, sources = cached
+            yield "token", answer
+            yield "sources", sources
+            return
+        
+        if RAG.admission.full():
+            raise RAG.admission.reject()
+        
+        similar_chunks = await RAG.retrieve(question, selection_id)
+        
+        if similar_chunks is None:
+            Metrics.questions.labels("failed").inc()
+            yield "token", "I couldn't process your question."
+            yield "sources", []
+            return
+        
+        if not similar_chunks:
+            Metrics.questions.labels("no_context").inc()
+            yield "token", "No relevant information in the documents."
+            yield "sources", []
+            return
+        
+        with Metrics.stage("query", "context"):
+            context, similar_chunks = ContextBuilder.build(similar_chunks)
+        
+        tokens = []
+        async with RAG.admission.slot():
+            with Metrics.stage("query", "llm"):
+                async for token in LLM.answerStream(question, context):
+                    tokens.append(token)
+                    yield "token", token
+        Metrics.questions.labels("answered").inc()
         
-        full_answer = f"{answer}\n\nSources:\n{sources_text}"
+        sources = RAG.sources(similar_chunks)
+        if tokens and not RAG.failed(tokens[-1]):
+            AnswerCache.store(ticket, question, "".join(tokens), sources)
         
-        return full_answer
\ No newline at end of file
+        yield "sources", sources
@@ -0,0 +1,148 @@
+import fcntl
+import json
+import os
+import struct
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from loguru import logger
+
+MAGIC = b"CSEG"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+ALIGN = 64
+
+class Segment:
+
+    def __init__(self, name, ids, doc_ids, matrix, scales):
+        self.name = name
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.matrix = matrix
+        self.scales = scales
+        self.count = len(ids)
+
+class SegmentStore:
+
+    # segments are immutable once written; manifest.json names the live ones, the
+    # deleted document ids and a generation that changes on every commit
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _flock(self, name, blocking=True):
+        # every call opens its own descriptor, so threads of one process exclude each other too
+        with open(os.path.join(self.path, name), "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def lock(self):
+        return self._flock(".manifest.lock")
+
+    def try_compaction_lock(self):
+        return self._flock(".compact.lock", blocking=False)
+
+    def try_catch_up_lock(self):
+        return self._flock(".catchup.lock", blocking=False)
+
+    def acquire_build_lock(self):
+        handle = open(os.path.join(self.path, ".build.lock"), "a")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    @staticmethod
+    def release_build_lock(handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    def stat(self):
+        try:
+            info = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return info.st_ino, info.st_mtime_ns, info.st_size
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def commit(self, update):
+        with self.lock():
+            manifest = self.read_manifest() or {"generation": 0, "segments": [], "deleted": []}
+            update(manifest)
+            manifest["generation"] += 1
+
+            temp_path = f"{self.manifest_path}.{uuid.uuid4().hex}"
+            with open(temp_path, "w") as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.manifest_path)
+            return manifest
+
+    def write_segment(self, ids, doc_ids, matrix, scales=None):
+        arrays = {"ids": ids, "doc_ids": doc_ids, "matrix": matrix}
+        if scales is not None:
+            arrays["scales"] = scales
+
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[key] = array
+            layout[key] = [offset, array.dtype.str, list(array.shape)]
+            offset += -(-array.nbytes // ALIGN) * ALIGN
+
+        header = json.dumps({"count": len(ids), "arrays": layout}).encode()
+        start = -(-(PREAMBLE.size + len(header)) // ALIGN) * ALIGN
+
+        name = f"{uuid.uuid4().hex}.seg"
+        path = os.path.join(self.path, name)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for key, array in arrays.items():
+                f.seek(start + layout[key][0])
+                f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return name
+
+    def open_segment(self, name):
+        path = os.path.join(self.path, name)
+        with open(path, "rb") as f:
+            magic, version, header_size = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{name} is not a version {VERSION} index segment")
+            header = json.loads(f.read(header_size))
+
+        start = -(-(PREAMBLE.size + header_size) // ALIGN) * ALIGN
+        arrays = {}
+        for key, (offset, dtype, shape) in header["arrays"].items():
+            arrays[key] = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=start + offset, shape=tuple(shape))
+
+        return Segment(name, arrays["ids"], arrays["doc_ids"], arrays["matrix"], arrays.get("scales"))
+
+    def remove_segments(self, names):
+        # processes that still map these keep their pages until they unmap
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+        logger.debug(f"Removed {len(names)} index segments")
@@ -0,0 +1,34 @@
+import numpy as np
+from loguru import logger
+from .cache import LRUCache
+from database.operations import DatabaseOperation
+from config import selectionCacheMB, selectionCacheTTL
+
+class SelectionCache:
+
+    # an empty array means nothing is selected, which searches every document
+    cache = LRUCache(
+        selectionCacheMB * 1024 * 1024,
+        ttl=selectionCacheTTL,
+        sizeof=lambda key, value: value.nbytes + len(key) + 200
+    )
+
+    @staticmethod
+    def _pack(document_ids):
+        return np.unique(np.asarray(list(document_ids), dtype=np.int32))
+
+    @classmethod
+    async def get(cls, selection_id="default"):
+        document_ids = cls.cache.get(selection_id)
+
+        if document_ids is None:
+            document_ids = cls._pack(await DatabaseOperation.get_selection(selection_id))
+            cls.cache.put(selection_id, document_ids)
+
+        return document_ids if len(document_ids) else None
+
+    @classmethod
+    async def set(cls, selection_id, document_ids):
+        await DatabaseOperation.doc_selection(document_ids, selection_id)
+        cls.cache.put(selection_id, cls._pack(document_ids))
+        logger.info(f"Selection {selection_id} now has {len(document_ids)} documents")
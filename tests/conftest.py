@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service.index import ChunkIndex
+from service.segments import SegmentStore
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setattr(ChunkIndex, "store", None)
+    monkeypatch.setattr(ChunkIndex, "quantization", "none")
+    ChunkIndex.begin_load()
+    yield ChunkIndex
+    ChunkIndex.abort_load()
+
+@pytest.fixture
+def shared_index(tmp_path, monkeypatch):
+    # compaction is started by hand so the tests do not race a background thread
+    monkeypatch.setattr("service.index.indexMaxSegments", 1000)
+    monkeypatch.setattr("service.index.indexMaxTombstones", 1000)
+    monkeypatch.setattr(ChunkIndex, "store", SegmentStore(str(tmp_path)))
+    monkeypatch.setattr(ChunkIndex, "quantization", "none")
+    ChunkIndex.begin_load()
+    yield ChunkIndex
+    ChunkIndex.abort_load()
@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+from api.qa import overloaded
+from service.admission import Admission, Overloaded, SingleFlight
+
+async def hold(admission, release):
+    async with admission.slot():
+        await release.wait()
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_full_queue_is_turned_away_with_429():
+    async def scenario():
+        admission = Admission(limit=1, queue_depth=1, queue_timeout=10)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, release)) for _ in range(2)]
+        await settle()
+        assert (admission.active, admission.waiting) == (1, 1)
+
+        with pytest.raises(Overloaded) as rejected:
+            async with admission.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return admission, rejected.value
+
+    admission, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert 1 <= error.retry_after <= 10
+    assert overloaded(error).headers == {"Retry-After": str(error.retry_after)}
+    assert (admission.admitted, admission.rejected) == (2, 1)
+
+def test_queue_timeout_gives_503():
+    async def scenario():
+        admission = Admission(limit=1, queue_depth=1, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, release))
+        await settle()
+
+        with pytest.raises(Overloaded) as timed_out:
+            async with admission.slot():
+                pass
+        release.set()
+        await holder
+        return admission, timed_out.value
+
+    admission, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.retry_after == 1
+    assert overloaded(error).headers["Retry-After"] == "1"
+    assert (admission.timed_out, admission.waiting) == (1, 0)
+
+def test_retry_after_is_capped_at_the_queue_timeout():
+    admission = Admission(limit=1, queue_depth=100, queue_timeout=15)
+    admission.average = 60.0
+    admission.waiting = 50
+
+    assert admission.retry_after() == 15
+
+def test_cancelled_callers_give_their_slot_back():
+    async def scenario():
+        admission = Admission(limit=1, queue_depth=1, queue_timeout=10)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(admission, release))
+        waiting = asyncio.create_task(hold(admission, release))
+        await settle()
+
+        running.cancel()
+        waiting.cancel()
+        await asyncio.gather(running, waiting, return_exceptions=True)
+        assert (admission.active, admission.waiting) == (0, 0)
+
+        # the slot is free again
+        async with admission.slot():
+            assert admission.active == 1
+
+    asyncio.run(scenario())
+
+def test_identical_requests_share_one_run():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def answer():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        callers = [asyncio.create_task(flights.run("question", answer)) for _ in range(3)]
+        await settle()
+        release.set()
+        return flights, calls, await asyncio.gather(*callers)
+
+    flights, calls, results = asyncio.run(scenario())
+    assert results == ["answer"] * 3
+    assert len(calls) == 1
+    assert flights.coalesced == 2
+    assert flights.flights == {}
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_run():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def answer():
+            await release.wait()
+            return "answer"
+
+        first = asyncio.create_task(flights.run("question", answer))
+        second = asyncio.create_task(flights.run("question", answer))
+        await settle()
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        release.set()
+        return first, await second
+
+    first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == "answer"
+
+def test_a_new_run_starts_after_the_last_one_finished():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def answer():
+            calls.append(1)
+            return len(calls)
+
+        return [await flights.run("question", answer) for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [1, 2]
@@ -0,0 +1,97 @@
+import asyncio
+import numpy as np
+import pytest
+from database.operations import DatabaseOperation
+from service.answers import AnswerCache
+from service.cache import LRUCache
+from service.embedding import Embedding
+
+QUESTIONS = {
+    "what is the refund policy": [1.0, 0.0, 0.0],
+    "what's the refund policy?": [0.99, 0.1, 0.0],
+    "who signed the contract": [0.0, 1.0, 0.0],
+    "when does the lease end": [0.0, 0.0, 1.0],
+}
+SELECTION = np.array([1, 2], dtype=np.int32)
+
+@pytest.fixture
+def corpus(monkeypatch):
+    state = {"version": 1}
+
+    async def embed(question):
+        return QUESTIONS[question]
+
+    async def corpus_version(document_ids):
+        return len(document_ids), state["version"]
+
+    monkeypatch.setattr(Embedding, "is_loaded", staticmethod(lambda: True))
+    monkeypatch.setattr(Embedding, "generate_Embedding", staticmethod(embed))
+    monkeypatch.setattr(DatabaseOperation, "corpus_version", staticmethod(corpus_version))
+    monkeypatch.setattr(AnswerCache, "cache", LRUCache(1024 * 1024, sizeof=lambda key, bucket: bucket.nbytes))
+    monkeypatch.setattr("service.answers.answerCacheThreshold", 0.95)
+    for counter in ("hits", "misses", "bypassed"):
+        monkeypatch.setattr(AnswerCache, counter, 0)
+    return state
+
+def ask(question, use_cache=True, answer=None):
+    # looks the question up and, on a miss, stores `answer` the way RAG does
+    async def scenario():
+        cached, ticket = await AnswerCache.lookup(question, SELECTION, use_cache)
+        if cached is None and answer is not None:
+            AnswerCache.store(ticket, question, answer, [{"document_id": 1}])
+        return cached
+    return asyncio.run(scenario())
+
+def test_similar_question_hits(corpus):
+    assert ask("what is the refund policy", answer="30 days") is None
+
+    assert ask("what's the refund policy?") == ("30 days", [{"document_id": 1}])
+    assert (AnswerCache.hits, AnswerCache.misses) == (1, 1)
+
+def test_different_question_misses(corpus):
+    ask("what is the refund policy", answer="30 days")
+
+    assert ask("who signed the contract") is None
+    assert AnswerCache.misses == 2
+
+def test_corpus_change_invalidates(corpus):
+    ask("what is the refund policy", answer="30 days")
+    corpus["version"] = 2
+
+    assert ask("what is the refund policy") is None
+
+def test_bypass_skips_lookup_but_refreshes_the_answer(corpus):
+    ask("what is the refund policy", answer="30 days")
+
+    assert ask("what is the refund policy", use_cache=False, answer="14 days") is None
+    assert AnswerCache.bypassed == 1
+    assert ask("what's the refund policy?")[0] == "14 days"
+    # the refreshed answer replaced the one it matched
+    bucket, _, _ = next(iter(AnswerCache.cache.entries.values()))
+    assert len(bucket.entries) == 1
+
+def test_bucket_keeps_the_newest_entries(corpus, monkeypatch):
+    monkeypatch.setattr("service.answers.answerCacheEntries", 2)
+    ask("what is the refund policy", answer="30 days")
+    ask("who signed the contract", answer="Alice")
+    ask("when does the lease end", answer="June")
+
+    assert ask("what is the refund policy") is None
+    assert ask("who signed the contract")[0] == "Alice"
+    assert ask("when does the lease end")[0] == "June"
+
+def test_cache_is_bounded_in_bytes(corpus, monkeypatch):
+    monkeypatch.setattr(AnswerCache, "cache", LRUCache(1000, sizeof=lambda key, bucket: bucket.nbytes))
+    ask("what is the refund policy", answer="x" * 400)
+    corpus["version"] = 2
+    ask("what is the refund policy", answer="y" * 400)
+
+    stats = AnswerCache.cache.stats()
+    assert stats["entries"] == 1 and stats["evictions"] == 1
+    assert stats["bytes"] <= 1000
+    assert ask("what is the refund policy")[0] == "y" * 400
+
+def test_disabled_without_the_model(corpus, monkeypatch):
+    monkeypatch.setattr(Embedding, "is_loaded", staticmethod(lambda: False))
+
+    assert asyncio.run(AnswerCache.lookup("what is the refund policy", SELECTION)) == (None, None)
@@ -0,0 +1,88 @@
+import asyncio
+import numpy as np
+import pytest
+from service.cache import LRUCache
+from service.embedding import Embedding
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("service.cache.time", clock)
+    return clock
+
+def test_least_recently_used_entry_is_evicted_by_size():
+    cache = LRUCache(10, sizeof=lambda key, value: len(value))
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+
+    cache.put("c", "xxxx")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx" and cache.get("c") == "xxxx"
+    assert cache.stats()["bytes"] == 8 and cache.evictions == 1
+
+def test_replacing_an_entry_frees_its_old_size():
+    cache = LRUCache(10, sizeof=lambda key, value: len(value))
+    cache.put("a", "xxxxxxxx")
+    cache.put("a", "xx")
+
+    assert cache.bytes == 2
+
+def test_entry_larger_than_the_cache_is_not_stored():
+    cache = LRUCache(10, sizeof=lambda key, value: len(value))
+    cache.put("a", "xxxx")
+    cache.put("b", "x" * 11)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx"
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = LRUCache(10, ttl=60)
+    cache.put("a", 1)
+
+    clock.now += 59
+    assert cache.get("a") == 1
+    assert cache.peek("a") == 1
+
+    clock.now += 2
+    assert cache.peek("a") is None
+    assert cache.get("a") is None
+    assert cache.expirations == 1 and cache.bytes == 0
+
+def test_peek_leaves_recency_alone():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.peek("a")
+    cache.put("c", 3)
+
+    assert cache.get("a") is None
+    assert cache.hits == 0 and cache.misses == 1
+
+def test_question_embeddings_are_cached_on_normalized_text(monkeypatch):
+    encoded = []
+
+    async def encode(text):
+        encoded.append(text)
+        return np.ones(2, dtype=np.float32)
+
+    monkeypatch.setattr(Embedding, "query_cache", LRUCache(1024 * 1024))
+    monkeypatch.setattr(Embedding.query_batcher, "encode", encode)
+
+    async def scenario():
+        first = await Embedding.generate_Embedding("What is  the refund policy?")
+        second = await Embedding.generate_Embedding(" What is the refund policy? ")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert encoded == ["What is the refund policy?"]
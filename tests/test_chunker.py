@@ -0,0 +1,114 @@
+import pytest
+from service.chunker import Chunker, Tokenizer, TokenChunker
+
+def words(text):
+    return text.split()
+
+def test_word_tokenizer_counts_words():
+    assert Tokenizer().count(["one two  three", "", "four"]) == [3, 0, 1]
+
+def test_sentences_are_packed_up_to_the_limit():
+    text = " ".join(f"Sentence number {n} here." for n in range(20))
+    chunks = TokenChunker(Tokenizer(), max_tokens=12, overlap_tokens=0).split_text(text)
+
+    # four-word sentences, three per chunk
+    assert [size for _, size in chunks] == [12] * 6 + [8]
+    assert all(len(words(chunk)) == size for chunk, size in chunks)
+    assert words(" ".join(chunk for chunk, _ in chunks)) == words(text)
+
+def test_overlap_repeats_whole_trailing_sentences():
+    text = " ".join(f"Sentence number {n} here." for n in range(6))
+    chunks = TokenChunker(Tokenizer(), max_tokens=12, overlap_tokens=4).split_text(text)
+
+    assert [chunk for chunk, _ in chunks] == [
+        "Sentence number 0 here. Sentence number 1 here. Sentence number 2 here.",
+        "Sentence number 2 here. Sentence number 3 here. Sentence number 4 here.",
+        "Sentence number 4 here. Sentence number 5 here.",
+    ]
+
+def test_overlap_is_capped_at_half_a_chunk():
+    assert TokenChunker(Tokenizer(), max_tokens=10, overlap_tokens=50).overlap == 5
+
+def test_paragraph_breaks_are_kept_inside_a_chunk():
+    chunks = TokenChunker(Tokenizer(), max_tokens=50, overlap_tokens=0).split_text(
+        "First paragraph here. Still first.\n\n  Second   paragraph."
+    )
+
+    assert chunks == [("First paragraph here. Still first.\n\nSecond paragraph.", 7)]
+
+def test_long_sentences_are_cut_on_token_bounds():
+    sentence = " ".join(f"w{n}" for n in range(25))
+    chunks = TokenChunker(Tokenizer(), max_tokens=10, overlap_tokens=0).split_text(sentence + ".")
+
+    assert [size for _, size in chunks] == [10, 10, 5]
+    assert words(" ".join(chunk for chunk, _ in chunks)) == words(sentence + ".")
+
+def test_special_tokens_come_off_the_limit():
+    tokenizer = Tokenizer()
+    tokenizer.special = 2
+    chunks = TokenChunker(tokenizer, max_tokens=10, overlap_tokens=0).split_text("a b c d. e f g h. i j.")
+
+    assert [size for _, size in chunks] == [8, 2]
+
+def test_hash_backend_counts_words(monkeypatch):
+    monkeypatch.setattr("service.chunker.embeddingBackend", "hash")
+    monkeypatch.setattr(Chunker, "tokenizer", None)
+
+    assert Chunker.get_tokenizer().model is None
+
+def test_missing_tokenizer_fails_instead_of_counting_words(monkeypatch):
+    def unavailable(name=None):
+        raise OSError(f"{name} not found")
+    monkeypatch.setattr("service.chunker.embeddingBackend", "onnx")
+    monkeypatch.setattr("service.chunker.Tokenizer", unavailable)
+    monkeypatch.setattr(Chunker, "tokenizer", None)
+
+    with pytest.raises(RuntimeError):
+        Chunker.get_tokenizer()
+    assert Chunker.tokenizer is None
+
+class Windows:
+
+    # stands in for the character splitter: fixed windows of words
+    def __init__(self, size):
+        self.size = size
+
+    def split_text(self, text):
+        words = text.split()
+        return [" ".join(words[start:start + self.size]) for start in range(0, len(words), self.size)]
+
+@pytest.fixture
+def limited(monkeypatch):
+    tokenizer = Tokenizer()
+    tokenizer.max_tokens = 8
+    monkeypatch.setattr(Chunker, "tokenizer", tokenizer)
+    monkeypatch.setattr(Chunker, "splitter", None)
+    monkeypatch.setattr(Chunker, "characters", Windows(20))
+    monkeypatch.setattr("service.chunker.chunkTokens", 256)
+    return tokenizer
+
+def test_chunks_are_capped_at_the_model_limit(limited, monkeypatch):
+    monkeypatch.setattr("service.chunker.chunker", "tokens")
+
+    assert Chunker.get_splitter().limit == 8
+
+def test_token_chunks_report_what_the_character_splitter_lost(limited, monkeypatch):
+    monkeypatch.setattr("service.chunker.chunker", "tokens")
+    text = " ".join(f"w{n}." for n in range(50))
+
+    chunks, embedded, truncated, legacy = Chunker.split(text)
+
+    assert truncated == 0
+    assert embedded == sum(len(words(chunk)) for chunk in chunks)
+    assert all(len(words(chunk)) <= 8 for chunk in chunks)
+    # windows of 20, 20 and 10 words, each cut at 8
+    assert legacy == 12 + 12 + 2
+
+def test_character_chunks_report_their_own_truncation(limited, monkeypatch):
+    monkeypatch.setattr("service.chunker.chunker", "characters")
+    text = " ".join(f"w{n}" for n in range(30))
+
+    chunks, embedded, truncated, legacy = Chunker.split(text)
+
+    assert len(chunks) == 2
+    assert (embedded, truncated, legacy) == (16, 14, 14)
@@ -0,0 +1,41 @@
+import json
+import numpy as np
+import pytest
+from database.codec import EmbeddingCodec
+
+def test_binary_round_trip():
+    vector = np.random.default_rng(0).normal(size=384).astype(np.float32)
+    data = EmbeddingCodec.encode(vector)
+
+    assert data[:2] == EmbeddingCodec.MAGIC
+    assert len(data) == EmbeddingCodec.HEADER.size + 384 * 4
+    decoded = EmbeddingCodec.decode(data)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, vector)
+
+def test_decodes_from_a_memoryview():
+    vector = np.arange(4, dtype=np.float32)
+    np.testing.assert_array_equal(EmbeddingCodec.decode(memoryview(EmbeddingCodec.encode(vector))), vector)
+
+def test_legacy_json_is_decoded():
+    vector = [0.25, -1.5, 3.0]
+    decoded = EmbeddingCodec.decode(json.dumps(vector).encode("utf-8"))
+
+    assert EmbeddingCodec.is_legacy(json.dumps(vector).encode("utf-8"))
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, np.asarray(vector, dtype=np.float32))
+
+def test_none_stays_none():
+    assert EmbeddingCodec.decode(None) is None
+
+@pytest.mark.parametrize("header", [
+    EmbeddingCodec.HEADER.pack(b"XX", EmbeddingCodec.VERSION, EmbeddingCodec.FLOAT32, 1),
+    EmbeddingCodec.HEADER.pack(EmbeddingCodec.MAGIC, 99, EmbeddingCodec.FLOAT32, 1),
+    EmbeddingCodec.HEADER.pack(EmbeddingCodec.MAGIC, EmbeddingCodec.VERSION, 7, 1),
+])
+def test_unknown_encodings_are_rejected(header):
+    with pytest.raises(ValueError):
+        EmbeddingCodec.decode(header + b"\0\0\0\0")
+
+def test_vector_literal():
+    assert EmbeddingCodec.to_vector_literal([1, 0.5, -2]) == "[1.0,0.5,-2.0]"
@@ -0,0 +1,68 @@
+from service.context import ContextBuilder, MIN_OVERLAP
+
+def chunk(chunk_id, document_id, chunk_index, text):
+    return {'id': chunk_id, 'document_id': document_id, 'chunk_index': chunk_index, 'chunk_text': text}
+
+SHARED = "the overlap the splitter repeated"
+FIRST = "The opening part of the section, ending with " + SHARED
+SECOND = SHARED + " and then the rest of the section."
+
+def test_overlap_finds_the_repeated_text():
+    assert ContextBuilder.overlap(FIRST, SECOND) == len(SHARED)
+
+def test_overlap_ignores_short_coincidences():
+    short = "x" * (MIN_OVERLAP - 1)
+    assert ContextBuilder.overlap("start " + short, short + " end") == 0
+
+def test_consecutive_chunks_merge_without_repeating_the_overlap():
+    passages = ContextBuilder.merge([chunk(2, 1, 1, SECOND), chunk(1, 1, 0, FIRST)])
+
+    assert len(passages) == 1
+    assert passages[0]['text'] == FIRST + SECOND[len(SHARED):]
+    assert [c['id'] for c in passages[0]['chunks']] == [1, 2]
+
+def test_consecutive_chunks_without_overlap_are_joined_by_a_newline():
+    passages = ContextBuilder.merge([chunk(1, 1, 0, "First chunk."), chunk(2, 1, 1, "Second chunk.")])
+
+    assert [p['text'] for p in passages] == ["First chunk.\nSecond chunk."]
+
+def test_gaps_and_other_documents_stay_separate_in_rank_order():
+    chunks = [
+        chunk(3, 1, 5, "later in document one"),
+        chunk(1, 1, 0, "start of document one"),
+        chunk(2, 2, 1, "document two"),
+    ]
+    passages = ContextBuilder.merge(chunks)
+
+    assert [p['text'] for p in passages] == ["later in document one", "start of document one", "document two"]
+
+def test_passage_takes_the_rank_of_its_best_chunk():
+    chunks = [chunk(9, 2, 0, "other document"), chunk(2, 1, 1, SECOND), chunk(1, 1, 0, FIRST)]
+    passages = ContextBuilder.merge(chunks)
+
+    assert [p['document_id'] for p in passages] == [2, 1]
+    assert passages[1]['position'] == 1
+
+def test_duplicate_text_is_kept_once():
+    passages = ContextBuilder.merge([chunk(1, 1, 0, "same text"), chunk(2, 2, 0, "same text")])
+
+    assert len(passages) == 1
+
+def test_build_skips_passages_over_budget_and_keeps_retrieval_order():
+    chunks = [
+        chunk(1, 1, 0, "a" * 40),
+        chunk(2, 2, 0, "b" * 400),
+        chunk(3, 3, 0, "c" * 40),
+    ]
+    context, used = ContextBuilder.build(chunks, budget=ContextBuilder.estimate_tokens("a" * 90))
+
+    assert context == "a" * 40 + "\n\n" + "c" * 40
+    assert [c['id'] for c in used] == [1, 3]
+
+def test_build_truncates_an_oversized_best_passage():
+    text = "word " * 200
+    context, used = ContextBuilder.build([chunk(1, 1, 0, text)], budget=10)
+
+    assert text.startswith(context)
+    assert ContextBuilder.estimate_tokens(context) <= 10
+    assert [c['id'] for c in used] == [1]
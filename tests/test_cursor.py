@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from api.doc_route import encode_cursor, decode_cursor, as_utc
+
+def raw(value):
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 3, 27, 10, 22, 15, 123456, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor({"created_at": created_at, "id": 42})) == (created_at, 42)
+
+def test_cursor_is_normalised_to_utc():
+    created_at = datetime(2025, 3, 27, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    decoded, _ = decode_cursor(encode_cursor({"created_at": created_at, "id": 1}))
+    assert decoded == created_at
+    assert decoded.tzinfo == timezone.utc
+
+def test_cursor_without_zone_is_utc():
+    decoded, _ = decode_cursor(raw("2025-03-27T10:00:00|7"))
+    assert decoded == datetime(2025, 3, 27, 10, 0, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw("2025-03-27T10:00:00"),
+    raw("2025-03-27T10:00:00|7|8"),
+    raw("yesterday|7"),
+    raw("2025-03-27T10:00:00|seven"),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+def test_as_utc():
+    assert as_utc(None) is None
+    assert as_utc(datetime(2025, 1, 1)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert as_utc(datetime(2025, 1, 1, 2, tzinfo=timezone(timedelta(hours=2)))).hour == 0
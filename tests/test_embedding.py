@@ -0,0 +1,116 @@
+import asyncio
+import numpy as np
+import pytest
+from service.embedding import Embedding, QueryBatcher
+
+class Encoder:
+
+    # stands in for the query lane; each call is one batch, held open until `gate` is set
+    def __init__(self):
+        self.batches = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.error = None
+
+    def encode(self, texts):
+        raise AssertionError("encodes go through the executor")
+
+    async def run(self, lane, fn, texts):
+        self.batches.append(list(texts))
+        await self.gate.wait()
+        if self.error:
+            raise self.error
+        return [np.full(2, len(text), dtype=np.float32) for text in texts]
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = Encoder()
+    monkeypatch.setattr(Embedding, "get_model", classmethod(lambda cls: encoder))
+    monkeypatch.setattr("service.embedding.Executor.run", encoder.run)
+    return encoder
+
+async def settle():
+    # the model is fetched in a thread before each batch reaches the encoder
+    await asyncio.sleep(0.05)
+
+def test_idle_batcher_encodes_at_once(encoder):
+    async def scenario():
+        batcher = QueryBatcher(max_batch=32, max_wait_ms=60_000)
+        return await asyncio.wait_for(batcher.encode("alpha"), 1)
+
+    assert asyncio.run(scenario()).tolist() == [5, 5]
+    assert encoder.batches == [["alpha"]]
+
+def test_questions_queued_behind_a_running_encode_share_a_batch(encoder):
+    async def scenario():
+        encoder.gate = asyncio.Event()
+        batcher = QueryBatcher(max_batch=32, max_wait_ms=60_000)
+        first = asyncio.create_task(batcher.encode("alpha"))
+        await settle()
+        queued = [asyncio.create_task(batcher.encode(text)) for text in ("b", "cc", "b")]
+        await settle()
+        assert encoder.batches == [["alpha"]]
+
+        encoder.gate.set()
+        return await first, await asyncio.gather(*queued)
+
+    first, queued = asyncio.run(scenario())
+    assert encoder.batches == [["alpha"], ["b", "cc"]]
+    assert [vector[0] for vector in queued] == [1, 2, 1]
+
+def test_full_batch_goes_without_waiting(encoder):
+    async def scenario():
+        encoder.gate = asyncio.Event()
+        batcher = QueryBatcher(max_batch=2, max_wait_ms=60_000)
+        tasks = [asyncio.create_task(batcher.encode(text)) for text in ("a", "b", "c")]
+        await settle()
+        batches = [list(batch) for batch in encoder.batches]
+        encoder.gate.set()
+        await asyncio.gather(*tasks)
+        return batches
+
+    assert asyncio.run(scenario()) == [["a"], ["b", "c"]]
+
+def test_busy_batcher_flushes_after_the_window(encoder):
+    async def scenario():
+        encoder.gate = asyncio.Event()
+        batcher = QueryBatcher(max_batch=32, max_wait_ms=10)
+        first = asyncio.create_task(batcher.encode("a"))
+        await settle()
+        second = asyncio.create_task(batcher.encode("b"))
+        await asyncio.sleep(0.05)
+        batches = [list(batch) for batch in encoder.batches]
+        encoder.gate.set()
+        await asyncio.gather(first, second)
+        return batches
+
+    assert asyncio.run(scenario()) == [["a"], ["b"]]
+
+def test_cancelled_caller_does_not_fail_others_with_the_same_text(encoder):
+    async def scenario():
+        encoder.gate = asyncio.Event()
+        batcher = QueryBatcher(max_batch=32, max_wait_ms=60_000)
+        first = asyncio.create_task(batcher.encode("a"))
+        await settle()
+        leaving = asyncio.create_task(batcher.encode("b"))
+        staying = asyncio.create_task(batcher.encode("b"))
+        await settle()
+
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        encoder.gate.set()
+        await first
+        return leaving, await staying
+
+    leaving, result = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert result.tolist() == [1, 1]
+
+def test_encode_failure_reaches_every_caller(encoder):
+    async def scenario():
+        encoder.error = RuntimeError("model crashed")
+        batcher = QueryBatcher(max_batch=32, max_wait_ms=60_000)
+        return await asyncio.gather(batcher.encode("a"), batcher.encode("a"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+# the query is (1, 0, 0); chunk 1 is the best match, chunk 4 scores about 0.45 and chunk 5 below zero
+CHUNKS = {
+    1: (10, unit(1.0, 0.1, 0.0)),
+    2: (10, unit(1.0, 0.5, 0.0)),
+    3: (20, unit(1.0, 0.3, 0.0)),
+    4: (20, unit(1.0, 2.0, 0.0)),
+    5: (30, unit(-1.0, 0.2, 0.0)),
+}
+QUERY = unit(1.0, 0.0, 0.0)
+
+def load(index, chunks=CHUNKS):
+    index.load_batch(list(chunks), [doc for doc, _ in chunks.values()], [vec for _, vec in chunks.values()])
+    index.finish_load()
+
+def test_top_k_in_score_order(index):
+    load(index)
+    ids, scores = index.search(QUERY, limit=3)
+
+    assert ids.tolist() == [1, 3, 2]
+    assert np.all(np.diff(scores) <= 0)
+    np.testing.assert_allclose(scores[0], CHUNKS[1][1] @ QUERY, rtol=1e-6)
+
+def test_scores_below_the_threshold_are_dropped(index):
+    load(index)
+
+    assert index.search(QUERY, limit=10, threshold=0.5)[0].tolist() == [1, 3, 2]
+    assert index.search(QUERY, limit=10, threshold=0)[0].tolist() == [1, 3, 2, 4]
+
+def test_selection_masks_other_documents(index):
+    load(index)
+    ids, _ = index.search(QUERY, document_ids=[20], limit=3, threshold=0)
+
+    assert ids.tolist() == [3, 4]
+
+def test_selection_without_matches_is_empty(index):
+    load(index)
+    ids, scores = index.search(QUERY, document_ids=[99])
+
+    assert len(ids) == 0 and len(scores) == 0
+
+def test_removed_document_is_not_returned(index):
+    load(index)
+    index.remove_document(10)
+    ids, _ = index.search(QUERY, limit=10, threshold=0)
+
+    assert ids.tolist() == [3, 4]
+    assert index.size == 3
+
+def test_chunks_added_while_loading_are_kept_once(index):
+    index.load_batch([1, 2], [10, 10], [CHUNKS[1][1], CHUNKS[2][1]])
+    # one chunk raced the snapshot and is in both; the other only arrived through add()
+    index.add([2, 3], 20, [CHUNKS[2][1], CHUNKS[3][1]])
+    index.finish_load()
+
+    assert index.size == 3
+    assert sorted(index.search(QUERY, limit=10)[0].tolist()) == [1, 2, 3]
+
+def test_unknown_lists_ids_not_in_the_index(index):
+    load(index)
+
+    assert index.unknown([3, 5, 6, 7]).tolist() == [6, 7]
+    assert index.unknown([1, 6], floor=1).tolist() == [1, 6]
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_shortlist_is_rescored_exactly(index, monkeypatch, quantization):
+    monkeypatch.setattr(index, "quantization", quantization)
+    rows = np.random.default_rng(0).normal(size=(200, 32)).astype(np.float32)
+    query = rows[17] + 0.05 * rows[3]
+    load(index, {chunk_id: (chunk_id % 5, row) for chunk_id, row in enumerate(rows, start=1)})
+
+    ids, _ = index.search(query, limit=5)
+    assert len(ids) == 5 * index.shortlist(1)
+
+    # the approximate scores only have to get the right rows into the shortlist
+    exact = index.normalize(rows) @ index.normalize(query)[0]
+    assert np.argmax(exact) + 1 in ids
+
+    rescored, scores = index.rescore(query, ids, rows[ids - 1], limit=5, threshold=-1)
+    best = ids[np.argsort(-exact[ids - 1])][:5]
+    assert rescored.tolist() == best.tolist()
+    np.testing.assert_allclose(scores, exact[best - 1], rtol=1e-5)
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_rescore_applies_the_threshold(index, monkeypatch, quantization):
+    monkeypatch.setattr(index, "quantization", quantization)
+    load(index)
+
+    # approximate scores only pick the shortlist, so the weak chunk survives until the exact rescore
+    ids, _ = index.search(QUERY, limit=4, threshold=0.5)
+    assert 4 in ids.tolist()
+
+    embeddings = [CHUNKS[chunk_id][1] for chunk_id in ids.tolist()]
+    rescored, scores = index.rescore(QUERY, ids, embeddings, limit=4, threshold=0.5)
+    assert rescored.tolist() == [1, 3, 2]
+    assert np.all(scores >= 0.5)
+
+def test_dimension_mismatch_is_rejected(index):
+    load(index)
+    with pytest.raises(ValueError):
+        index.add([9], 10, [unit(1.0, 0.0, 0.0, 0.0)])
+
+def test_excluded_documents_are_masked(index):
+    load(index)
+    ids, _ = index.search(QUERY, limit=3, threshold=0, excluded={10})
+
+    assert ids.tolist() == [3, 4]
+
+def test_documents_of_chunks(index):
+    load(index)
+
+    assert index.documents([1, 4, 99]).tolist() == [10, 20]
+    assert index.documents([]).tolist() == []
@@ -0,0 +1,83 @@
+import asyncio
+from contextlib import asynccontextmanager
+import numpy as np
+import pytest
+from database.codec import EmbeddingCodec
+from database.operations import DatabaseOperation
+
+def vector(seed):
+    return np.random.default_rng(seed).normal(size=8).astype(np.float32)
+
+class Table:
+
+    # documents and document_chunks as the database holds them; chunk id -> document id
+    def __init__(self, chunks):
+        self.chunks = dict(chunks)
+        self.loaded = []
+
+    async def fetch(self, query, ids=None):
+        if "FROM documents" in query:
+            documents = set(self.chunks.values())
+            return [{'id': document_id} for document_id in ids if document_id in documents]
+        return [{'id': chunk_id} for chunk_id in self.chunks]
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def cursor(self, query, ids, prefetch):
+        for chunk_id, document_id in sorted(self.chunks.items()):
+            if ids is None or chunk_id in ids:
+                self.loaded.append(chunk_id)
+                yield {'id': chunk_id, 'document_id': document_id, 'chunk_embedding': EmbeddingCodec.encode(vector(chunk_id))}
+
+@pytest.fixture
+def table(shared_index, monkeypatch):
+    table = Table({1: 10, 2: 10, 3: 20, 4: 30})
+
+    @asynccontextmanager
+    async def acquire():
+        yield table
+
+    monkeypatch.setattr("database.operations.acquire", acquire)
+    asyncio.run(DatabaseOperation.load_index())
+    assert table.loaded == [1, 2, 3, 4]
+    return table
+
+def restart(index):
+    index.begin_load()
+    asyncio.run(DatabaseOperation.load_index())
+
+def indexed(index):
+    return sorted(
+        int(chunk_id)
+        for part in index.parts()
+        for chunk_id, document_id in zip(part.ids, part.doc_ids)
+        if document_id not in index.deleted
+    )
+
+def test_restart_reuses_an_index_in_step_with_the_database(shared_index, table):
+    table.loaded = []
+    restart(shared_index)
+
+    assert table.loaded == []
+    assert indexed(shared_index) == [1, 2, 3, 4]
+
+def test_restart_adds_chunks_stored_while_down(shared_index, table):
+    # a chunk above the high-water mark and one below it that committed late
+    table.chunks.update({6: 40, 5: 40})
+    table.loaded = []
+    restart(shared_index)
+
+    assert table.loaded == [5, 6]
+    assert indexed(shared_index) == [1, 2, 3, 4, 5, 6]
+    assert shared_index.catch_up_floor() == 6
+
+def test_restart_tombstones_documents_deleted_while_down(shared_index, table):
+    del table.chunks[1], table.chunks[2]
+    restart(shared_index)
+
+    assert 10 in shared_index.deleted
+    assert indexed(shared_index) == [3, 4]
+    ids, _ = shared_index.search(vector(1), limit=4, threshold=-1)
+    assert not set(ids.tolist()) & {1, 2}
@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+import numpy as np
+import pytest
+from database.codec import EmbeddingCodec
+from database.operations import DatabaseOperation
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+QUERY = unit(1.0, 0.0)
+
+class Rows:
+
+    # document_chunks joined with documents, as another process left them
+    def __init__(self, chunks, live):
+        self.chunks = chunks
+        self.live = live
+        self.fetches = 0
+
+    async def fetch(self, query, chunk_ids):
+        self.fetches += 1
+        return [
+            {
+                'id': chunk_id, 'chunk_text': f"chunk {chunk_id}", 'document_id': document_id,
+                'chunk_index': 0, 'filename': f"{document_id}.pdf",
+                'chunk_embedding': EmbeddingCodec.encode(vector), 'live': self.live.get(document_id, True)
+            }
+            for chunk_id, (document_id, vector) in self.chunks.items()
+            if chunk_id in chunk_ids
+        ]
+
+@pytest.fixture
+def rows(index, monkeypatch):
+    chunks = {
+        1: (10, unit(1.0, 0.05)),
+        2: (10, unit(1.0, 0.1)),
+        3: (20, unit(1.0, 0.15)),
+        4: (30, unit(1.0, 0.2)),
+        5: (30, unit(1.0, 0.25)),
+    }
+    index.load_batch(list(chunks), [doc for doc, _ in chunks.values()], [vec for _, vec in chunks.values()])
+    index.finish_load()
+
+    # document 10 was deleted and document 20 is a stalled ingest, both in another process
+    del chunks[1], chunks[2]
+    table = Rows(chunks, live={20: False})
+
+    @asynccontextmanager
+    async def acquire():
+        yield table
+
+    async def caught_up():
+        pass
+
+    monkeypatch.setattr("database.operations.acquire", acquire)
+    monkeypatch.setattr(DatabaseOperation, "catch_up_index", caught_up)
+    return table
+
+def test_dead_documents_do_not_take_top_k_slots(index, rows):
+    results = asyncio.run(DatabaseOperation.index_chunks_search(QUERY, limit=2))
+
+    assert [chunk['id'] for chunk in results] == [4, 5]
+    assert rows.fetches == 3
+
+def test_deleted_documents_are_dropped_from_the_index(index, rows):
+    asyncio.run(DatabaseOperation.index_chunks_search(QUERY, limit=2))
+
+    assert index.size == 3
+    # the stalled document may still finish, so it is only skipped for that query
+    assert asyncio.run(DatabaseOperation.index_chunks_search(QUERY, limit=2))[0]['id'] == 4
+    assert 3 in index.search(QUERY, limit=5, threshold=0)[0]
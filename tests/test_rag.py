@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+import service.rag as rag
+from database.operations import DatabaseOperation
+from service.embedding import Embedding
+from service.rag import RAG
+from service.selection import SelectionCache
+
+def chunk(id, rank):
+    return {"id": id, "chunk_text": f"chunk {id}", "document_id": 1, "chunk_index": id, "filename": f"{id}.pdf", "rank": rank}
+
+def rrf(*positions):
+    return sum(1.0 / (rag.rrfK + position + 1) for position in positions)
+
+def test_fuse_orders_by_reciprocal_rank():
+    vector = RAG.scored([chunk(1, 0.9), chunk(2, 0.8), chunk(3, 0.7)], "similarity")
+    lexical = RAG.scored([chunk(3, 0.4), chunk(4, 0.3), chunk(1, 0.1)], "text_rank")
+
+    fused = RAG.fuse(vector, lexical)
+
+    # found by both beats found by one, and the raw scores play no part
+    assert [c["id"] for c in fused] == [1, 3, 2, 4]
+    assert fused[0]["rank"] == pytest.approx(rrf(0, 2))
+    assert fused[1]["rank"] == pytest.approx(rrf(2, 0))
+    assert fused[2]["rank"] == pytest.approx(rrf(1))
+    assert fused[3]["rank"] == pytest.approx(rrf(1))
+
+def test_fuse_keeps_each_rankers_score():
+    vector = RAG.scored([chunk(1, 0.9), chunk(2, 0.8)], "similarity")
+    lexical = RAG.scored([chunk(2, 0.4), chunk(3, 0.3)], "text_rank")
+
+    fused = {c["id"]: c for c in RAG.fuse(vector, lexical)}
+
+    assert (fused[1]["similarity"], fused[1].get("text_rank")) == (0.9, None)
+    assert (fused[2]["similarity"], fused[2]["text_rank"]) == (0.8, 0.4)
+    assert (fused[3].get("similarity"), fused[3]["text_rank"]) == (None, 0.3)
+
+def test_sources_label_scores_by_ranker():
+    fused = RAG.fuse(
+        RAG.scored([chunk(1, 0.9)], "similarity"),
+        RAG.scored([chunk(2, 0.4), chunk(1, 0.1)], "text_rank")
+    )
+
+    sources = RAG.sources(fused)
+    text = RAG.format_answer("answer", sources)
+
+    assert sources[1] == {
+        "document_id": 1, "filename": "2.pdf", "similarity": None, "text_rank": 0.4, "score": rrf(0)
+    }
+    assert "- 1.pdf (Similarity: 0.9000, Text match: 0.1000)" in text
+    assert "- 2.pdf (Text match: 0.4000)" in text
+
+@pytest.mark.parametrize("mode,expected", [
+    ("hybrid", [("1.pdf", 0.9, None), ("4.pdf", None, 0.3)]),
+    ("vector", [("1.pdf", 0.9, None)]),
+    ("lexical", [("4.pdf", None, 0.3)]),
+])
+def test_retrieve_tags_scores_for_every_mode(monkeypatch, mode, expected):
+    async def selection(selection_id):
+        return None
+
+    async def embed(question):
+        return [1.0, 0.0]
+
+    async def vector(query_embedding, limit, document_ids):
+        return [chunk(1, 0.9)]
+
+    async def lexical(question, limit, document_ids):
+        return [chunk(4, 0.3)]
+
+    monkeypatch.setattr(rag, "retrievalMode", mode)
+    monkeypatch.setattr(SelectionCache, "get", staticmethod(selection))
+    monkeypatch.setattr(Embedding, "is_loaded", staticmethod(lambda: True))
+    monkeypatch.setattr(Embedding, "generate_Embedding", staticmethod(embed))
+    monkeypatch.setattr(DatabaseOperation, "similar_chunks_search", staticmethod(vector))
+    monkeypatch.setattr(DatabaseOperation, "lexical_chunks_search", staticmethod(lexical))
+
+    chunks = asyncio.run(RAG.retrieve("question"))
+
+    assert [(s["filename"], s["similarity"], s["text_rank"]) for s in RAG.sources(chunks)] == expected
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+import numpy as np
+from service.segments import SegmentStore
+
+def vectors(count, dimension=8, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def build(index, chunk_ids, document_ids, embeddings):
+    assert index.claim()
+    index.load_batch(chunk_ids, document_ids, embeddings)
+    index.finish_load()
+
+def test_segment_round_trip(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    ids = np.arange(10, 15, dtype=np.int64)
+    doc_ids = np.array([1, 1, 2, 2, 3], dtype=np.int32)
+    matrix = np.random.default_rng(1).integers(-127, 127, size=(5, 7), dtype=np.int8)
+    scales = np.linspace(0.1, 0.5, 5, dtype=np.float32)
+
+    segment = store.open_segment(store.write_segment(ids, doc_ids, matrix, scales))
+
+    assert segment.count == 5
+    np.testing.assert_array_equal(segment.ids, ids)
+    np.testing.assert_array_equal(segment.doc_ids, doc_ids)
+    np.testing.assert_array_equal(segment.matrix, matrix)
+    np.testing.assert_array_equal(segment.scales, scales)
+    assert isinstance(segment.matrix, np.memmap)
+
+def test_segment_without_scales(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    matrix = vectors(3)
+    segment = store.open_segment(store.write_segment(np.arange(3), np.zeros(3, dtype=np.int32), matrix))
+
+    np.testing.assert_array_equal(segment.matrix, matrix)
+    assert segment.scales is None
+
+def test_refresh_maps_segments_committed_elsewhere(shared_index, tmp_path):
+    embeddings = vectors(4)
+    build(shared_index, [1, 2, 3, 4], [1, 1, 2, 2], embeddings)
+
+    # another process appends a segment through its own store
+    other = SegmentStore(str(tmp_path))
+    fresh = vectors(1, seed=5)
+    name = other.write_segment(np.array([9], dtype=np.int64), np.array([7], dtype=np.int32), fresh)
+    other.commit(lambda manifest: manifest["segments"].append(name))
+
+    ids, scores = shared_index.search(fresh)
+    assert ids[0] == 9
+    assert scores[0] > 0.99
+    assert shared_index.size == 5
+
+def test_removed_document_is_hidden_then_compacted(shared_index, tmp_path, monkeypatch):
+    embeddings = vectors(4)
+    build(shared_index, [1, 2, 3, 4], [1, 1, 2, 2], embeddings)
+    shared_index.add([5, 6], 3, vectors(2, seed=3))
+    shared_index.remove_document(1)
+
+    assert 1 not in shared_index.search(embeddings[0])[0]
+    before = shared_index.store.read_manifest()
+    assert before["deleted"] == [1]
+
+    monkeypatch.setattr("service.index.indexMaxTombstones", 0)
+    shared_index.compact()
+
+    manifest = shared_index.store.read_manifest()
+    assert manifest["deleted"] == []
+    assert len(manifest["segments"]) == 1
+    for name in before["segments"]:
+        assert not os.path.exists(tmp_path / name)
+
+    segment = shared_index.store.open_segment(manifest["segments"][0])
+    assert sorted(segment.ids.tolist()) == [3, 4, 5, 6]
+    assert 1 not in segment.doc_ids
+
+    ids, _ = shared_index.search(embeddings[0], limit=10)
+    assert set(ids.tolist()) <= {3, 4, 5, 6}
+
+def test_shared_writes_run_off_the_event_loop(shared_index, monkeypatch):
+    build(shared_index, [1, 2], [1, 1], vectors(2))
+
+    threads = []
+    write_segment = shared_index.store.write_segment
+    def record(*args):
+        threads.append(threading.current_thread())
+        return write_segment(*args)
+    monkeypatch.setattr(shared_index.store, "write_segment", record)
+
+    asyncio.run(shared_index.offload(shared_index.add, [3], 2, vectors(1, seed=2)))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert 3 in shared_index.search(vectors(1, seed=2))[0]
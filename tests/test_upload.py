@@ -0,0 +1,109 @@
+import asyncio
+import io
+import zipfile
+import pytest
+from fastapi import HTTPException
+import api.doc_route as doc_route
+from api.doc_route import expand_upload, upload_batch
+from database.operations import DatabaseOperation
+
+MB = 1024 * 1024
+
+class Upload:
+
+    def __init__(self, filename, content, content_type="application/pdf"):
+        self.filename = filename
+        self.content_type = content_type
+        self.content = content
+
+    async def read(self):
+        return self.content
+
+def archive(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in entries.items():
+            z.writestr(name, content)
+    return buffer.getvalue()
+
+@pytest.fixture
+def queued(monkeypatch):
+    jobs = []
+
+    async def insert_jobs(batch, batch_id):
+        jobs.extend(batch)
+        return list(range(1, len(batch) + 1))
+
+    monkeypatch.setattr(DatabaseOperation, "insert_jobs", staticmethod(insert_jobs))
+    monkeypatch.setattr(doc_route.IngestWorkers, "notify", classmethod(lambda cls: None))
+    monkeypatch.setattr(doc_route, "batchMaxFiles", 3)
+    monkeypatch.setattr(doc_route, "batchMaxFileMB", 1)
+    monkeypatch.setattr(doc_route, "batchMaxTotalMB", 2)
+    return jobs
+
+def upload(*files):
+    return asyncio.run(upload_batch(list(files)))
+
+def test_expand_plain_file():
+    [(name, content_type, size, read)] = expand_upload("a.pdf", "application/pdf", b"%PDF-1")
+    assert (name, content_type, size, read()) == ("a.pdf", "application/pdf", 6, b"%PDF-1")
+
+def test_expand_zip_skips_directories_and_metadata():
+    data = archive({
+        "docs/a.pdf": b"a" * 10,
+        "docs/notes.txt": b"text",
+        "docs/.DS_Store": b"x",
+        "__MACOSX/docs/._a.pdf": b"x",
+        "docs/sub/": b"",
+    })
+
+    # readers are only valid while the archive is being walked
+    entries = [(name, content_type, size, read()) for name, content_type, size, read in expand_upload("docs.zip", "application/zip", data)]
+
+    assert entries == [
+        ("a.pdf", "application/pdf", 10, b"a" * 10),
+        ("notes.txt", "application/octet-stream", 4, b"text"),
+    ]
+
+def test_batch_queues_pdfs_and_rejects_the_rest(queued):
+    response = upload(
+        Upload("a.pdf", b"%PDF-a"),
+        Upload("notes.txt", b"text", "text/plain"),
+        Upload("empty.pdf", b""),
+    )
+
+    assert [(f.filename, f.status, f.job_id) for f in response.files] == [
+        ("a.pdf", "queued", 1), ("notes.txt", "rejected", None), ("empty.pdf", "rejected", None)
+    ]
+    assert queued == [("a.pdf", "application/pdf", b"%PDF-a")]
+
+def test_batch_rejects_a_file_over_the_size_limit(queued):
+    response = upload(Upload("big.pdf", b"x" * (MB + 1)), Upload("small.pdf", b"x"))
+
+    assert [(f.filename, f.status) for f in response.files] == [("big.pdf", "rejected"), ("small.pdf", "queued")]
+    assert "larger than 1 MB" in response.files[0].error
+
+def test_batch_counts_files_inside_archives(queued):
+    data = archive({f"{i}.pdf": b"x" for i in range(3)})
+
+    with pytest.raises(HTTPException) as e:
+        upload(Upload("docs.zip", data, "application/zip"), Upload("extra.pdf", b"x"))
+
+    assert e.value.status_code == 400
+    assert queued == []
+
+def test_batch_rejects_too_much_after_unzipping(queued):
+    # well under the limits compressed, over the total once inflated
+    data = archive({"a.pdf": b"\0" * (MB - 1), "b.pdf": b"\0" * (MB - 1), "c.pdf": b"\0" * (MB - 1)})
+    assert len(data) < MB
+
+    with pytest.raises(HTTPException) as e:
+        upload(Upload("docs.zip", data, "application/zip"))
+
+    assert e.value.status_code == 413
+    assert queued == []
+
+def test_batch_rejects_a_bad_archive(queued):
+    response = upload(Upload("docs.zip", b"not a zip", "application/zip"), Upload("a.pdf", b"x"))
+
+    assert [(f.filename, f.status) for f in response.files] == [("docs.zip", "rejected"), ("a.pdf", "queued")]